@@ -1,6 +1,7 @@
 """A library for assessing allosteric modulation of proteins via an sMD/MSM protocol.
 """
 import os as _os
+from shutil import which as _which
 
 
 __all__ = ['analysis',
@@ -15,11 +16,6 @@ if 'AMBERHOME' not in _os.environ:
     print('An installation of AMBER is required: https://ambermd.org/. Please install AMBER and set the AMBERHOME environment variable')
 
 # find GROMACS in PATH
-_gmx = False
-for loc in _os.environ['PATH'].split(':'):
-    if _os.path.exists(loc):
-        if 'gmx' in _os.listdir(loc):
-            _gmx = True
-            break
+_gmx = _which('gmx') is not None
 if not _gmx:
    print('A GROMACS installation is required: https://www.gromacs.org/. Please install GROMACS and include it in your PATH')
\ No newline at end of file
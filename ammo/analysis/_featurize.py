@@ -1,6 +1,4 @@
 import os
-from random import choice
-from string import ascii_lowercase
 import subprocess
 from numpy import loadtxt
 
@@ -39,8 +37,8 @@ def featurize(trajectory, topology, feature, mask, reference=None, shared='!@/H'
     cpptraj_input = [f'parm {os.path.abspath(topology)}\n',
                      f'trajin {os.path.abspath(trajectory)}\n']
 
-    file = f'/tmp/cpptraj_{"".join(choice(ascii_lowercase) for i in range(10))}.in'
-    output = f'/tmp/cpptraj_{"".join(choice(ascii_lowercase) for i in range(10))}.out'
+    file = f'/tmp/cpptraj_{os.urandom(5).hex()}.in'
+    output = f'/tmp/cpptraj_{os.urandom(5).hex()}.out'
         
     # calculate the feature
     if feature == 'rmsd':
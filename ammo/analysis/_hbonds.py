@@ -1,6 +1,4 @@
 import os
-from string import ascii_lowercase
-from random import choice
 from pandas import read_csv
 from subprocess import run, DEVNULL
 from pytraj import save, Trajectory
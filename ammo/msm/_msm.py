@@ -2,25 +2,70 @@
 building and analysing Markov State Models contained by MSMCollection in such a way
 that they are comparable, e.g. using the same clusters and metastable states"""
 
-from os import path as _path, remove as _remove
+from os import path as _path, cpu_count as _cpu_count
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor, ProcessPoolExecutor as _ProcessPoolExecutor
 import pickle as _pickle
 import pyemma.plots as _plots
 from pyemma.coordinates import cluster_kmeans as _kmeans, assign_to_centers as _assign_to_centers
 from pyemma.msm import timescales_msm as _timescales, bayesian_markov_model as _bayesian_msm
 from pyemma import config as _pyemma_config
 import numpy as _np
+from pandas import read_csv as _read_csv
 from matplotlib.cm import ScalarMappable as _scalarmappable
 from matplotlib.colors import Normalize as _colornorm
-from matplotlib.pyplot import subplots as _subplots
+from matplotlib.pyplot import subplots as _subplots, figure as _figure
 from seaborn import light_palette as _light_palette, color_palette as _color_palette
-from subprocess import run as _subprocess
-from scipy.optimize import curve_fit as _curve_fit
+from scipy.spatial.distance import cdist as _cdist
 from ammo.utils._utils import __parse_time as _parse_time
 
 
 _pyemma_config.show_progress_bars = False
 
 
+def _build_bootstrapped_msm(dtrajs, lag, n_clusters):
+    """
+    Build a bayesian msm from resampled trajectories and return the stationary distribution over all clusters.
+    Kept at module level so that it can be run in worker processes.
+
+    Parameters
+    ----------
+    dtrajs : [numpy.array]
+        resampled discrete trajectories
+
+    lag : int
+        msm lag time in steps
+
+    n_clusters : int
+        total number of clusters
+
+    Returns
+    -------
+    stationary_distribution : numpy.array
+        stationary distribution of bootstrapped msm
+    """
+    #build msm
+    bootstrap_msm = _bayesian_msm(dtrajs, lag)
+
+    #get stationary distribution, with 0 probability for clusters outside the active set
+    stationary_distribution = _np.zeros(n_clusters)
+    stationary_distribution[bootstrap_msm.active_set] = bootstrap_msm.stationary_distribution
+
+    return stationary_distribution
+
+
+def _violin_samples(data, max_samples=5000):
+    """Randomly subsample violin plot data, as the KDE cost grows with the number of samples.
+    The minimum and maximum are always kept, so that the plotted extrema are those of the full data"""
+    rng = _np.random.default_rng(0)
+    samples = []
+    for values in data:
+        values = _np.asarray(values)
+        if values.size > max_samples:
+            values = _np.append(rng.choice(values, max_samples-2, replace=False), [values.min(), values.max()])
+        samples.append(values)
+    return samples
+
+
 class MSMCollection:
     """A collection of MSMs, intended for easier comparison.
     """
@@ -57,7 +102,7 @@ class MSMCollection:
             titles in the correct format
         """
         if titles is None:
-            correct_titles = [key for key in self._MSMs.keys()]
+            correct_titles = list(self._MSMs)
         elif type(titles) == str:
             correct_titles = [titles]
         elif type(titles) == list:
@@ -204,7 +249,9 @@ class MSMCollection:
         """
         titles = self.__fix_titles(titles)
 
-        all_data = _np.array(_np.vstack([_np.vstack(self._MSMs[key].data) for key in titles]))
+        # each MSM keeps its frames in one contiguous array, so only one copy is needed
+        all_data = _np.concatenate([self._MSMs[key]._all_data for key in titles])
+
         return all_data
 
     def cluster(self, titles=None, n_clusters=100, max_iter=50, centers=None):
@@ -229,13 +276,14 @@ class MSMCollection:
         None
         """
         titles = self.__fix_titles(titles)
-        cluster_data = self.get_all_data(titles)
+        # contiguous float64 input avoids internal copies in kmeans
+        cluster_data = _np.ascontiguousarray(self.get_all_data(titles), dtype=_np.float64)
 
         self.clusters = _kmeans(cluster_data, k=n_clusters, max_iter=max_iter, clustercenters=centers, keep_data=True)
 
         return None
 
-    def assign_to_clusters(self, titles=None, clusters=None):
+    def assign_to_clusters(self, titles=None, clusters=None, n_jobs=None):
         """Assign all MSM trajectory data to clusters
         
         Parameters
@@ -245,6 +293,9 @@ class MSMCollection:
         
         clusters : numpy.array(n_clusters, n_features)
             custom cluster centers to assign to. Otherwise will be assigned to clusters.clustercenters
+
+        n_jobs : int
+            number of threads used for the assignment. If None, all available CPUs will be used
         
         Returns
         -------
@@ -256,7 +307,7 @@ class MSMCollection:
             clusters = self.clusters.clustercenters
 
         for key in titles:
-            self._MSMs[key].assign_to_clusters(clusters)
+            self._MSMs[key].assign_to_clusters(clusters, n_jobs)
 
         return None
 
@@ -328,9 +379,9 @@ class MSMCollection:
             if time_units is not None:
                 for i in range(n):
                     factor = _parse_time(self._MSMs[titles[i]].timestep, time_units, output_type='number')
-                    ax[i].set_xticklabels([int(val) for val in ax[i].get_xticks()*factor])
+                    ax[i].set_xticklabels((ax[i].get_xticks()*factor).astype(int))
                     ax[i].set_xlabel(f'lag time / {time_units}')
-                    ax[i].set_yticklabels([val for val in ax[i].get_yticks()*factor])
+                    ax[i].set_yticklabels(ax[i].get_yticks()*factor)
                     ax[i].set_ylabel(f'timescale / {time_units}')
             fig.tight_layout()
             return fig, ax
@@ -417,25 +468,25 @@ class MSMCollection:
         # find the same density limits
         clims = []
         for key in titles:
-            X, Y, Z = _plots.plots2d.get_histogram(_np.vstack(self._MSMs[key].data)[:, x],
-                                                         _np.vstack(self._MSMs[key].data)[:, y])
+            X, Y, Z = _plots.plots2d.get_histogram(self._MSMs[key]._all_data[:, x],
+                                                         self._MSMs[key]._all_data[:, y])
             density = _plots.plots2d._to_density(Z)
             clims.append((density.min(), density.max()))
         clims = (_np.array(clims)[:, 0].min(), _np.array(clims)[:, 1].max())
 
         # find the same axes limits
-        limits = [_np.hstack([_np.vstack(self._MSMs[key].data)[:, x] for key in titles]).min(),
-                  _np.hstack([_np.vstack(self._MSMs[key].data)[:, x] for key in titles]).max(),
-                  _np.hstack([_np.vstack(self._MSMs[key].data)[:, y] for key in titles]).min(),
-                  _np.hstack([_np.vstack(self._MSMs[key].data)[:, y] for key in titles]).max()]
+        limits = [_np.hstack([self._MSMs[key]._all_data[:, x] for key in titles]).min(),
+                  _np.hstack([self._MSMs[key]._all_data[:, x] for key in titles]).max(),
+                  _np.hstack([self._MSMs[key]._all_data[:, y] for key in titles]).min(),
+                  _np.hstack([self._MSMs[key]._all_data[:, y] for key in titles]).max()]
 
         # reshape titles and plot
         titles = _np.array(titles).reshape(shape)
         for row in range(shape[0]):
             for col in range(shape[1]):
                 fig_curr, ax_curr, misc_curr = _plots.plot_density(
-                    _np.vstack(self._MSMs[titles[row, col]].data)[:, x],
-                    _np.vstack(self._MSMs[titles[row, col]].data)[:, y],
+                    self._MSMs[titles[row, col]]._all_data[:, x],
+                    self._MSMs[titles[row, col]]._all_data[:, y],
                     ax=ax[row, col], cbar=False, vmax=clims[1], cmap=cmap)
                 ax_curr.set_xlim((limits[0], limits[1]))
                 ax_curr.set_ylim((limits[2], limits[3]))
@@ -567,18 +618,18 @@ class MSMCollection:
         clims = (min(probs), max(probs))
 
         # find the same axes limits
-        limits = [_np.hstack([_np.vstack(self._MSMs[key].data)[:, x] for key in titles]).min(),
-                  _np.hstack([_np.vstack(self._MSMs[key].data)[:, x] for key in titles]).max(),
-                  _np.hstack([_np.vstack(self._MSMs[key].data)[:, y] for key in titles]).min(),
-                  _np.hstack([_np.vstack(self._MSMs[key].data)[:, y] for key in titles]).max()]
+        limits = [_np.hstack([self._MSMs[key]._all_data[:, x] for key in titles]).min(),
+                  _np.hstack([self._MSMs[key]._all_data[:, x] for key in titles]).max(),
+                  _np.hstack([self._MSMs[key]._all_data[:, y] for key in titles]).min(),
+                  _np.hstack([self._MSMs[key]._all_data[:, y] for key in titles]).max()]
 
         titles = _np.array(titles).reshape(shape)
         for row in range(shape[0]):
             for col in range(shape[1]):
                 fig_curr, ax_curr, misc_curr = _plots.plot_contour(
-                    _np.vstack(self._MSMs[titles[row, col]].data)[:, x],
-                    _np.vstack(self._MSMs[titles[row, col]].data)[:, y],
-                    _np.array(self._MSMs[titles[row, col]].stationary_distribution)[_np.hstack(self._MSMs[titles[row, col]].dtrajs)],
+                    self._MSMs[titles[row, col]]._all_data[:, x],
+                    self._MSMs[titles[row, col]]._all_data[:, y],
+                    _np.array(self._MSMs[titles[row, col]].stationary_distribution)[self._MSMs[titles[row, col]]._dtraj_flat],
                     ax=ax[row, col], cbar=False, vmax=clims[1], cmap=cmap, method='nearest', mask=True)
                 ax_curr.set_xlim((limits[0], limits[1]))
                 ax_curr.set_ylim((limits[2], limits[3]))
@@ -815,7 +866,8 @@ class MSMCollection:
         
         return None
 
-    def bootstrapping(self, n_states, msm=None, titles=None, lag_time=None, cluster_centers=None, min_iter=100, max_iter=100, tol=1, last=10, verbose=False, overwrite=False):
+    def bootstrapping(self, n_states, msm=None, titles=None, lag_time=None, cluster_centers=None, min_iter=100, max_iter=100, tol=1, last=10, verbose=False, overwrite=False,
+                      n_jobs=1):
         """
         Compute bootstrapped probabilities until they have converged to a Gaussian distribution or until maximum number
         of iterations have been reached.
@@ -854,6 +906,9 @@ class MSMCollection:
 
         overwrite : bool
             whether to overwrite existing probabilities
+
+        n_jobs : int
+            number of bootstrapped msms to build in parallel processes. If None, all cores will be used
         
         Returns
         -------
@@ -874,7 +929,8 @@ class MSMCollection:
             print(f'Bootstrapped probabilities, based on {pcca} MSM, {n_states} states:')
             for key in titles:
                 print(key)
-                probabilities[key] = self._MSMs[key].bootstrapping(n_states, self._MSMs[pcca], lag_time, cluster_centers, min_iter, max_iter, tol, last, verbose)
+                probabilities[key] = self._MSMs[key].bootstrapping(n_states, self._MSMs[pcca], lag_time, cluster_centers, min_iter, max_iter, tol, last, verbose,
+                                                                     n_jobs=n_jobs)
                 print('-'*30)
         
         return probabilities
@@ -923,15 +979,17 @@ class MSMCollection:
                 states = [i+1 for i in range(n_states)]
         if not (isinstance(states, list) or isinstance(states, _np.ndarray)):
             states = [states]
-        if isinstance(states[0], str):
+        states = _np.asarray(states)
+        if states.dtype.kind == 'U':
             state_labels = states
-            state_idxs = [_np.where(self._MSMs[assignment_title].state_labels[n_states]==state_name)[0][0] for state_name in states]
-        elif isinstance(states[0], int):
+            label_idxs = {name: i for i, name in enumerate(self._MSMs[assignment_title].state_labels[n_states])}
+            state_idxs = _np.array([label_idxs[state_name] for state_name in states])
+        elif states.dtype.kind in 'iu':
+            state_idxs = states - 1
             if n_states in self._MSMs[assignment_title].state_labels:
-                state_labels = [self._MSMs[assignment_title].state_labels[3][i-1] for i in states]
+                state_labels = self._MSMs[assignment_title].state_labels[n_states][state_idxs]
             else:
                 state_labels = [f'state {i}' for i in states]
-            state_idxs = [i-1 for i in states]
         else:
             raise ValueError('"states" has to be int, str, or list of int or str')
 
@@ -941,12 +999,12 @@ class MSMCollection:
             xticklabels = titles
             ylabels = [f'{state.capitalize()} state probability/%' for state in state_labels]
             for idx in state_idxs:
-                data.append([self._MSMs[title].bootstrapping_data[assignment]['probabilities'][:,idx] for title in titles])
+                data.append([self._MSMs[title].bootstrapping_data[assignment]['probabilities_T'][idx] for title in titles])
         elif xaxis == 'states':
             xticklabels = state_labels
             ylabels = [f'State probabilities of {title} MSM/%' for title in titles]
             for title in titles:
-                data.append([self._MSMs[title].bootstrapping_data[assignment]['probabilities'][:,idx] for idx in state_idxs])
+                data.append([self._MSMs[title].bootstrapping_data[assignment]['probabilities_T'][idx] for idx in state_idxs])
 
         # get figure parameters
         max_cols = 3
@@ -956,26 +1014,25 @@ class MSMCollection:
         height = shape[0]*5
 
         # plot violin
-        fig, ax = _subplots(shape[0], shape[1], figsize=(width, height))
-        ax = _np.hstack(ax)
-        for i in range(len(ax)):
-            # if no more data, make invisible
-            if i >= len(data):
-                ax[i].set_visible(False)
-            else:
-                violins = ax[i].violinplot(data[i])
-                # change color
-                if colors is None:
-                    colors = _color_palette(None, len(data[i]))
-                for violin, color in zip(violins['bodies'], colors):
-                    violin.set_color(color)
-                violins['cmaxes'].set_color('black')
-                violins['cbars'].set_color('black')
-                violins['cmins'].set_color('black')
-                # set ticks and labels
-                ax[i].set_xticks(_np.arange(1, len(xticklabels)+1))
-                ax[i].set_xticklabels(xticklabels, size=14)
-                ax[i].set_ylabel(ylabels[i], size=14)
+        # only create axes for grid cells that have data
+        fig = _figure(figsize=(width, height))
+        grid = fig.add_gridspec(shape[0], shape[1])
+        n_axes = min(len(data), shape[0]*shape[1])
+        ax = _np.array([fig.add_subplot(grid[i//shape[1], i%shape[1]]) for i in range(n_axes)])
+        for i in range(n_axes):
+            violins = ax[i].violinplot(_violin_samples(data[i]))
+            # change color
+            if colors is None:
+                colors = _color_palette(None, len(data[i]))
+            for violin, color in zip(violins['bodies'], colors):
+                violin.set_color(color)
+            violins['cmaxes'].set_color('black')
+            violins['cbars'].set_color('black')
+            violins['cmins'].set_color('black')
+            # set ticks and labels
+            ax[i].set_xticks(_np.arange(1, len(xticklabels)+1))
+            ax[i].set_xticklabels(xticklabels, size=14)
+            ax[i].set_ylabel(ylabels[i], size=14)
 
         fig.tight_layout()
 
@@ -991,8 +1048,11 @@ class MSM:
         self.features = None
         self.__traj_locations = []
         self.data = None
+        self._all_data = None
+        self._traj_offsets = None
         self.cluster_centers = None
         self.dtrajs = None
+        self._dtraj_flat = None
         self.its = None
         self.msm = None
         self.pcca = {}
@@ -1002,6 +1062,46 @@ class MSM:
         self.bootstrapping_data = {}
         self.mfpt = {}
         self.mfpr = {}
+        self._rng = _np.random.default_rng()
+        self._bootstrap_centers = None
+        self._bootstrap_dtrajs = None
+
+    def __getstate__(self):
+        # trajectory views would be pickled as copies of the data
+        state = self.__dict__.copy()
+        if self._all_data is not None:
+            state['data'] = None
+        # bootstrapping assignments are a cache, reassign after loading
+        state['_bootstrap_centers'] = None
+        state['_bootstrap_dtrajs'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # MSMs saved before data was kept contiguous
+        if '_all_data' not in state:
+            self._all_data = None
+            self._traj_offsets = None
+            if self.data:
+                self._all_data = _np.concatenate(self.data)
+                self._traj_offsets = _np.cumsum([0] + [trajectory.shape[0] for trajectory in self.data])
+        if '_dtraj_flat' not in state:
+            self._dtraj_flat = _np.concatenate(self.dtrajs) if self.dtrajs is not None else None
+        if '_rng' not in state:
+            self._rng = _np.random.default_rng()
+        if '_bootstrap_dtrajs' not in state:
+            self._bootstrap_centers = None
+            self._bootstrap_dtrajs = None
+        # bootstrapping results saved before the transposed probabilities were stored
+        for data in self.bootstrapping_data.values():
+            if 'probabilities_T' not in data and 'probabilities' in data:
+                data['probabilities_T'] = _np.ascontiguousarray(data['probabilities'].T)
+        if self._all_data is not None:
+            self.data = self.__trajectory_views()
+
+    def __trajectory_views(self):
+        """Split the contiguous data array into per-trajectory views"""
+        return [self._all_data[start:end] for start, end in zip(self._traj_offsets[:-1], self._traj_offsets[1:])]
 
     def load_data(self, locations, file_names, trajectories=_np.arange(1, 101), frames=5000, timestep='10 ps', features=None, missing='ignore'):
         """Read the featurised trajectory data into the MSM
@@ -1049,35 +1149,70 @@ class MSM:
             self.features = [None for _ in range(len(file_names))]
 
         # load featurised data
+        # reading is I/O bound, so snapshots are read in parallel threads
+        # but added in order
         self.data = []
         missing_idx = []
-        for directory in locations:
-            print(directory)
-            for idx in trajectories:
-                print('trajectory %3i/%i' % (idx, trajectories[-1]), end='\r')
-                # check if required files are there
-                files = [f'{directory}/snapshot_{idx}/{name}' for name in file_names]
-                if all([_path.exists(file) for file in files]):
-                    #add to list
-                    self.__traj_locations.append(f'{directory}/snapshot_{idx}')
-                    # create data array
-                    trajectory_data = _np.zeros((frames, 1))
-                    for file in files:
-                        trajectory_data = _np.append(trajectory_data, _np.loadtxt(file)[:frames].reshape(frames, 1),
-                                                    axis=1)
-                    # drop zeros and add to data
-                    trajectory_data = _np.delete(trajectory_data, 0, 1)
-                    self.data.append(trajectory_data)
-                elif missing == 'error':
-                    raise IOError(f'Data missing in {directory}/snapshot_{idx}')
-                elif missing == 'warn':
-                    missing_idx.append(f'{directory}/snapshot_{idx}')
+        with _ThreadPoolExecutor(max_workers=_cpu_count()) as executor:
+            for directory in locations:
+                print(directory)
+                snapshots = [executor.submit(self.__read_snapshot, f'{directory}/snapshot_{idx}', file_names, frames)
+                             for idx in trajectories]
+                for idx, snapshot in zip(trajectories, snapshots):
+                    print('trajectory %3i/%i' % (idx, trajectories[-1]), end='\r')
+                    trajectory_data = snapshot.result()
+                    if trajectory_data is not None:
+                        #add to list
+                        self.__traj_locations.append(f'{directory}/snapshot_{idx}')
+                        self.data.append(trajectory_data)
+                    elif missing == 'error':
+                        raise IOError(f'Data missing in {directory}/snapshot_{idx}')
+                    elif missing == 'warn':
+                        missing_idx.append(f'{directory}/snapshot_{idx}')
         print()
+        # keep all frames in one contiguous array, with self.data as views of each trajectory
+        if len(self.data) > 0:
+            self._all_data = _np.concatenate(self.data)
+            self._traj_offsets = _np.cumsum([0] + [trajectory.shape[0] for trajectory in self.data])
+            self.data = self.__trajectory_views()
 
         if len(missing_idx) > 0:
             print('Missing data:')
             print('\n'.join(missing_idx))
 
+    def __read_snapshot(self, snapshot, file_names, frames):
+        """Read featurised data of a single snapshot
+
+        Parameters
+        ----------
+        snapshot : str
+            snapshot directory
+
+        file_names : [str]
+            names of files containing featurised trajectory data
+
+        frames : int
+            number of frames to load
+
+        Returns
+        -------
+        trajectory_data : numpy.array, (frames, n_files)
+            trajectory data. None if any of the files are missing
+        """
+        # check if required files are there
+        files = [f'{snapshot}/{name}' for name in file_names]
+        if not all([_path.exists(file) for file in files]):
+            return None
+
+        # create data array with a column for each file
+        trajectory_data = _np.empty((frames, len(files)), dtype=_np.float64)
+        for i, file in enumerate(files):
+            # pandas C parser is much faster than numpy.loadtxt
+            trajectory_data[:, i] = _read_csv(file, sep=r'\s+', header=None, comment='#', nrows=frames,
+                                              dtype=_np.float64, engine='c').to_numpy()[:, 0]
+
+        return trajectory_data
+
     def plot_data(self, x=0, y=1, features='infer', cmap=None):
         """Plot the data the MSM as a 2D density plot.
 
@@ -1109,7 +1244,7 @@ class MSM:
         if cmap is None:
             cmap = _light_palette("seagreen", as_cmap=True)
 
-        fig, ax, misc = _plots.plot_density(_np.vstack(self.data)[:, x], _np.vstack(self.data)[:, y], cmap=cmap)
+        fig, ax, misc = _plots.plot_density(self._all_data[:, x], self._all_data[:, y], cmap=cmap)
         
         # get axis names
         if features == 'infer':
@@ -1148,17 +1283,20 @@ class MSM:
         -------
         None
         """
-        self.cluster_centers = _kmeans(_np.vstack(self.data), k=n_clusters, max_iter=max_iter, clustercenters=centers, keep_data=True).clustercenters
+        self.cluster_centers = _kmeans(_np.ascontiguousarray(self._all_data, dtype=_np.float64), k=n_clusters, max_iter=max_iter, clustercenters=centers, keep_data=True).clustercenters
 
         return None
 
-    def assign_to_clusters(self, cluster_centers=None):
+    def assign_to_clusters(self, cluster_centers=None, n_jobs=None):
         """Assign the MSM trajectory data to clusters
         
         Parameters
         ----------
         cluster_centers : numpy.array
             cluster centers to assign to
+
+        n_jobs : int
+            number of threads used for the assignment. If None, all available CPUs will be used
             
         Returns
         ------
@@ -1166,7 +1304,8 @@ class MSM:
         """
         if cluster_centers is not None:
             self.cluster_centers = cluster_centers
-        self.dtrajs = _assign_to_centers(data=self.data, centers=self.cluster_centers)
+        self.dtrajs = _assign_to_centers(data=self.data, centers=self.cluster_centers, n_jobs=n_jobs)
+        self._dtraj_flat = _np.concatenate(self.dtrajs)
 
     def compute_its(self, lags_to_try=(1, 5, 10, 25, 50, 100, 250, 500, 750, 1000, 1500, 2000, 2500, 3000), nits=10,
                     errors='bayes', plot=True, time_units=None):
@@ -1206,9 +1345,9 @@ class MSM:
             # fix axes units if required
             if time_units is not None:
                 factor = _parse_time(self.timestep, time_units, output_type='number')
-                ax.set_xticklabels([int(val) for val in ax.get_xticks()*factor])
+                ax.set_xticklabels((ax.get_xticks()*factor).astype(int))
                 ax.set_xlabel(f'lag time / {time_units}')
-                ax.set_yticklabels([val for val in ax.get_yticks()*factor])
+                ax.set_yticklabels(ax.get_yticks()*factor)
                 ax.set_ylabel(f'timescale / {time_units}')
             return fig, ax
         
@@ -1233,19 +1372,9 @@ class MSM:
         self.msm = _bayesian_msm(self.dtrajs, lag_time)
 
         # add zero probability for disconnected sets
-        self.stationary_distribution = self.msm.stationary_distribution
-        disconnected_sets = self.msm.connected_sets[1:]
-        if len(disconnected_sets)>0:
-            disconnected_sets = _np.hstack(disconnected_sets)
-            #sort disconnected sets so that the probabilities are inserted correctly
-            disconnected_sets.sort()
-            for center in disconnected_sets:
-                self.stationary_distribution = _np.insert(self.stationary_distribution, center, 0.0)
-                
-        #if trajectory data was never assigned to a cluster centre at the end of the list, e.g. center 99, it does not appear in disconnected sets
-        #therefore need to append 0.0 probability until there are the same number of stationary distributions as cluster centers
-        while len(self.stationary_distribution)!=len(self.cluster_centers):
-            self.stationary_distribution = _np.append(self.stationary_distribution, 0.0)
+        # and cluster centers that were never visited
+        self.stationary_distribution = _np.zeros(len(self.cluster_centers))
+        self.stationary_distribution[self.msm.active_set] = self.msm.stationary_distribution
 
     def run_pcca(self, n_states, disconnected=None):
         """Run PCCA on the MSM
@@ -1267,19 +1396,14 @@ class MSM:
         self.msm.pcca(n_states)
 
         # remap metastable sets to original clusters
-        remapped = []
-        for i in range(len(self.msm.metastable_sets)):
-            metastable = [self.msm.connected_sets[0][center] for center in self.msm.metastable_sets[i]]
-            remapped.append(_np.array(metastable))
-
-        # ensure center indices are integers
-        for state in range(n_states):
-            remapped[state] = _np.array([int(center) for center in remapped[state]])
+        # as integer center indices
+        connected = self.msm.connected_sets[0]
+        remapped = [connected[metastable].astype(int) for metastable in self.msm.metastable_sets]
 
         # sort metastable sets based on average center distance from origin
-        distances = _np.array([])
-        for state in range(n_states):
-            distances = _np.append(distances, _np.linalg.norm(self.cluster_centers[list(remapped[state])], axis=1).mean())
+        center_norms = _np.linalg.norm(self.cluster_centers, axis=1)
+        distances = _np.array([center_norms[remapped[state]].mean() if len(remapped[state]) > 0 else 0.0
+                               for state in range(n_states)])
         # replace distances of 0 (i.e. empty sets) with highest value + offset
         # to put them at the back rather than the front
         distances[distances==0.0] = distances.max() + 10
@@ -1292,21 +1416,20 @@ class MSM:
         # if not specified, find the closest metastable cluster
         # to each disconnected cluster center
         if disconnected is None:
-            cluster_av = _np.array([self.cluster_centers[list(reordered[i])].mean(axis=0) for i in range(n_states)])
-            for i in range(1, len(self.msm.connected_sets)):
-                for center_idx in self.msm.connected_sets[i]:
-                    center_xyz = _np.array([self.cluster_centers[center_idx]])
-                    to_add = _np.linalg.norm(cluster_av-center_xyz, axis=1).argmin()
-                    modified_state = _np.append(reordered[to_add], center_idx)
-                    modified_state.sort()
-                    reordered[to_add] = modified_state.astype(int)
+            if len(self.msm.connected_sets) > 1:
+                cluster_av = _np.array([self.cluster_centers[list(reordered[i])].mean(axis=0) for i in range(n_states)])
+                disconnected_idxs = _np.concatenate(self.msm.connected_sets[1:])
+                # closest metastable cluster for all disconnected centers at once
+                targets = _cdist(self.cluster_centers[disconnected_idxs], cluster_av, metric='sqeuclidean').argmin(axis=1)
+                for state in range(n_states):
+                    to_add = disconnected_idxs[targets==state]
+                    if len(to_add) > 0:
+                        reordered[state] = _np.sort(_np.concatenate([reordered[state], to_add])).astype(int)
         else:
-            state_to_add = reordered[disconnected]
+            state_to_add = list(reordered[disconnected])
             for i in range(1, len(self.msm.connected_sets)):
-                for center_idx in self.msm.connected_sets[i]:
-                    state_to_add = _np.append(state_to_add, center_idx)
-            state_to_add.sort()
-            reordered[disconnected] = state_to_add.astype(int)    
+                state_to_add.extend(self.msm.connected_sets[i])
+            reordered[disconnected] = _np.sort(_np.asarray(state_to_add, dtype=int))
 
         self.pcca[n_states] = reordered
 
@@ -1370,6 +1493,14 @@ class MSM:
             msm = self
         title = f'{msm.title}, {n_states} states'
 
+        # if already assigned
+        # checked first so that no pcca or weights are computed for a no-op
+        if title in self.metastable_assignments and not overwrite:
+            if verbose:
+                for key, info in self.metastable_assignments[title].items():
+                    print(f'MS {key} has {info[2]} counts and {info[0]}% probability (± {info[1]}%)')
+            return None
+
         # use msm pcca metastable sets and weights
         # but can specify different sets and weights for modifying
         # which clusters should be included
@@ -1380,25 +1511,19 @@ class MSM:
         if weights is None:
             weights = [_np.ones(len(sets)) for sets in metastable_sets]
 
-        # if already assigned
-        if title in self.metastable_assignments and not overwrite:
-            if verbose:
-                for key, info in self.metastable_assignments[title].items():
-                    print(f'MS {key} has {info[2]} counts and {info[0]}% probability (± {info[1]}%)')
-            return None
- 
         # find the probabilities
         self.metastable_assignments[title] = {}
         for i in range(len(metastable_sets)):
             if len(metastable_sets[i]) > 0:
-                probability = round((self.stationary_distribution[metastable_sets[i]] * weights[i]).sum() * 100, 2)
-                error = round(_np.std(self.stationary_distribution[metastable_sets[i]] * weights[i]) * 100, 2)
+                weighted = self.stationary_distribution[metastable_sets[i]] * weights[i]
+                probability = round(weighted.sum() * 100, 2)
+                error = round(weighted.std() * 100, 2)
                 counts = len(metastable_sets[i])
             else:
                 probability = 0
                 error = 0
                 counts = 0
-            self.metastable_assignments[f'{msm.title}, {n_states} states'][i + 1] = [probability, error, counts]
+            self.metastable_assignments[title][i + 1] = [probability, error, counts]
             if verbose:
                 print(f'MS {i + 1} has {counts} counts and {probability}% probability (± {error}%)')
 
@@ -1473,8 +1598,8 @@ class MSM:
         misc : dict
             mappable and cbar
         """
-        z = _np.array(self.stationary_distribution)[_np.hstack(self.dtrajs)]
-        fig, ax, misc = _plots.plot_contour(_np.vstack(self.data)[:,x], _np.vstack(self.data)[:,y], z, method='nearest', mask=True, cmap=cmap)
+        z = _np.array(self.stationary_distribution)[self._dtraj_flat]
+        fig, ax, misc = _plots.plot_contour(self._all_data[:,x], self._all_data[:,y], z, method='nearest', mask=True, cmap=cmap)
         ax.scatter(self.cluster_centers[:,x], self.cluster_centers[:,y], s=8, c=color)
         misc['cbar'].set_label('stationary probability')
 
@@ -1532,24 +1657,30 @@ class MSM:
         metastable_sets = msm.pcca[n_states]
 
         # fix metastable sets to only include active sets
-        for i, centers in enumerate(metastable_sets):
-            new_centers = [_np.where(self.msm.active_set == center)[0][0] for center in centers if
-                           center in self.msm.active_set]
-            metastable_sets[i] = _np.array(new_centers)
+        # active set is sorted, so the positions can be found with a binary search
+        active_set = self.msm.active_set
+        active_sets = []
+        for centers in metastable_sets:
+            centers = _np.asarray(centers, dtype=int)
+            active_sets.append(_np.searchsorted(active_set, centers[_np.isin(centers, active_set)]))
+        metastable_sets = active_sets
 
         n_sets = len(metastable_sets)
         mfpt_sample = _np.zeros((n_sets, n_sets, self.msm.nsamples))
-        # loop over sets
-        for i in range(n_sets):
-            for j in range(n_sets):
-                if i != j:  # if a transition
-                    mfpt_sample[i, j] = self.msm.sample_f('mfpt', metastable_sets[i], metastable_sets[j])
-                    mfpt_sample[i, j] = mfpt_sample[i, j] * step_time  # get the right units
-                    self.mfpt[title][f'{i + 1},{j + 1}'] = [mfpt_sample[i, j].mean(), _np.std(mfpt_sample[i, j]),
-                                                            step_units]
-                    if verbose:
-                        print(
-                            f'{i + 1}->{j + 1} transition: {round(mfpt_sample[i, j].mean(), 3)} {step_units} (± {round(_np.std(mfpt_sample[i, j]), 3)} {step_units})')
+        # sample all transitions in parallel
+        transitions = [(i, j) for i in range(n_sets) for j in range(n_sets) if i != j]
+        with _ThreadPoolExecutor(max_workers=_cpu_count()) as executor:
+            samples = [executor.submit(self.msm.sample_f, 'mfpt', metastable_sets[i], metastable_sets[j])
+                       for i, j in transitions]
+        # loop over transitions
+        for (i, j), sample in zip(transitions, samples):
+            mfpt_sample[i, j] = sample.result()
+            mfpt_sample[i, j] *= step_time  # get the right units
+            self.mfpt[title][f'{i + 1},{j + 1}'] = [mfpt_sample[i, j].mean(), _np.std(mfpt_sample[i, j]),
+                                                    step_units]
+            if verbose:
+                print(
+                    f'{i + 1}->{j + 1} transition: {round(mfpt_sample[i, j].mean(), 3)} {step_units} (± {round(_np.std(mfpt_sample[i, j]), 3)} {step_units})')
 
     def compute_mfpr(self, n_states, timestep=None, msm=None, verbose=True, overwrite=False):
         """Compute mean first passage rates for the MSM, based on specified pcca metastable state assignment
@@ -1599,9 +1730,11 @@ class MSM:
         if title not in self.mfpt or overwrite:
             self.compute_mfpt(n_states, timestep, msm, False, overwrite)
 
-        for key, info in self.mfpt[title].items():
-            rate = 1 / info[0]
-            error = rate * (info[1] / info[0])
+        # rates and errors for all transitions at once
+        mfpts = _np.array([info[:2] for info in self.mfpt[title].values()]).reshape(-1, 2)
+        rates = 1 / mfpts[:, 0]
+        errors = rates * (mfpts[:, 1] / mfpts[:, 0])
+        for (key, info), rate, error in zip(self.mfpt[title].items(), rates, errors):
             self.mfpr[title][key] = [rate, error, info[2]]
             if verbose:
                 print(
@@ -1631,21 +1764,22 @@ class MSM:
         """
         if msm is None:
             msm = self
+        title = f'{msm.title}, {n_states} states'
 
-        if f'{msm.title}, {n_states} states' not in self.metastable_assignments.keys():
-            self.assign_to_metastable(n_states, msm, verbose=False, overwrite=overwrite)
-        if f'{msm.title}, {n_states} states' not in self.mfpr.keys():
+        if title not in self.metastable_assignments.keys():
+            self.assign_to_metastable(n_states, msm=msm, verbose=False, overwrite=overwrite)
+        if title not in self.mfpr.keys():
             self.compute_mfpr(n_states, timestep, msm, verbose=False, overwrite=overwrite)
+        assignments = self.metastable_assignments[title]
+        rates = self.mfpr[title]
 
         ratios = {}
         for i in range(1, n_states + 1):
             for j in range(i, n_states + 1):
                 if i != j:
                     print(f'States {i} and {j}:')
-                    states = [self.metastable_assignments[f'{msm.title}, {n_states} states'][i][0],
-                              self.metastable_assignments[f'{msm.title}, {n_states} states'][j][0]]
-                    transitions = [self.mfpr[f'{msm.title}, {n_states} states'][f'{i},{j}'][0],
-                                   self.mfpr[f'{msm.title}, {n_states} states'][f'{j},{i}'][0]]
+                    states = [assignments[i][0], assignments[j][0]]
+                    transitions = [rates[f'{i},{j}'][0], rates[f'{j},{i}'][0]]
                     ratios[f'{i},{j}'] = (max(states) / min(states), max(transitions) / min(transitions))
                     print(f'State ratio: {round(max(states) / min(states), 2)}')
                     print(f'Transition timescale ratio: {round(max(transitions) / min(transitions), 2)}')
@@ -1653,7 +1787,7 @@ class MSM:
 
         return ratios
 
-    def sample_weighted_trajectories(self, n_frames, outputs=None, topology=None, distributions=None):
+    def sample_weighted_trajectories(self, n_frames, outputs=None, topology=None, distributions=None, binary=False):
         """Sample trajectory data based on MSM distributions
 
         Parameters
@@ -1671,11 +1805,16 @@ class MSM:
             distributions to base the sampling on. Must be same length as active set (i.e. removed disconnected states).
             If None, own stationary distribution will be used.
 
+        binary : bool
+            whether to save the sampled frame indices as a binary .npy file instead of a .txt file
+
         Returns
         -------
         samples : numpy.array
             sampled trajectory and frame indices
         """
+        import pytraj as _pt
+
         if distributions is None:
             distributions = _np.array([self.msm.stationary_distribution])
 
@@ -1693,88 +1832,87 @@ class MSM:
         
         # save if output provided
         for all_frames, output in zip(samples, outputs):
-            file = '/tmp/cpptraj_sample_tmp.in'
-            with open(file, 'w') as fl:
-                fl.writelines(f'parm {_path.abspath(topology)}\n')
-                for frame in all_frames:
-                    fl.writelines(f'trajin {self.__traj_locations[frame[0]]}/production_dry.nc {frame[1]+1} {frame[1]+1}\n')
-                fl.writelines(f'trajout {_path.abspath(output)}\n')
-                fl.writelines('go\n')
-                fl.writelines('quit\n')
-            
-            _subprocess(['cpptraj', '-i', file])
-            _remove(file)
-
-            # save which frames were sampled
-            _np.savetxt(output.split('.')[0]+'.txt', all_frames, fmt='%i')
+            # sort by trajectory and frame, so that consecutive frames can be read as one block
+            all_frames = all_frames[_np.lexsort((all_frames[:,1], all_frames[:,0]))]
+            breaks = _np.flatnonzero((_np.diff(all_frames[:,0]) != 0) | (_np.diff(all_frames[:,1]) != 1)) + 1
+            starts = _np.concatenate([[0], breaks])
+            ends = _np.concatenate([breaks, [len(all_frames)]]) - 1
+            files = [f'{self.__traj_locations[traj]}/production_dry.nc' for traj in all_frames[starts,0]]
+            blocks = list(zip(all_frames[starts,1].tolist(), all_frames[ends,1].tolist()))
+
+            # read the frames in process, one slice per block
+            trajectory = _pt.iterload(files, top=_path.abspath(topology), frame_slice=[(start, end+1) for start, end in blocks])
+            _pt.write_traj(_path.abspath(output), trajectory, overwrite=True)
+
+            # save which frames were sampled, in the order they were written
+            if binary:
+                _np.save(output.split('.')[0]+'.npy', all_frames)
+            else:
+                with open(output.split('.')[0]+'.txt', 'w') as fl:
+                    fl.write(''.join(f'{traj} {frame}\n' for traj, frame in all_frames.tolist()))
 
         return samples
 
-    def __gauss(self, x, *p):
-        A, mu, sigma = p
-        return A*_np.exp(-(x-mu)**2/(2.*sigma**2))
-
-    def __fit_gaus(self, data):
+    def __bootstrap_dtrajs(self, cluster_centers=None):
         """
-        coeff : A, mu, sigma
+        Get discrete trajectories to resample for bootstrapping. Data is assigned to different cluster centers
+        only once and the assignment is reused while the same centers are given
+
+        Parameters
+        ----------
+        cluster_centers : [float], numpy.array
+            cluster centers to assign data to. If None, msm own cluster centers will be used
+
+        Returns
+        -------
+        dtrajs : [numpy.array]
+            discrete trajectories
+
+        n_clusters : int
+            number of clusters
         """
-        data = _np.array(data)
-        hist, bin_edges = _np.histogram(data)
-        bin_centres = (bin_edges[:-1] + bin_edges[1:])/2
-        p0 = [10, data.mean(), 10]
-        coeff, var_matrix = _curve_fit(self.__gauss, bin_centres, hist, p0=p0)
+        if cluster_centers is None:
+            return self.dtrajs, len(self.cluster_centers)
 
-        return coeff
+        cluster_centers = _np.asarray(cluster_centers)
+        if self._bootstrap_centers is None or not _np.array_equal(self._bootstrap_centers, cluster_centers):
+            self._bootstrap_dtrajs = _assign_to_centers(self.data, cluster_centers)
+            self._bootstrap_centers = cluster_centers.copy()
 
-    def __build_bootstrapped_msm(self, lag, cluster_centers=None):
+        return self._bootstrap_dtrajs, len(cluster_centers)
+
+    def __submit_bootstrapped_msm(self, executor, dtrajs, lag, n_clusters):
         """
-        Build an msm with randomly resampled data and return state probability
+        Resample the trajectories and submit building a bootstrapped msm from them
         
         Parameters
         ----------
+        executor : concurrent.futures.Executor
+            executor to build the msm with
+
+        dtrajs : [numpy.array]
+            discrete trajectories to resample
+
         lag : int
             msm lag time in steps        
-        cluster_centers : [float], numpy.array
-            cluster centers to assign data to. If None, msm own cluster centers will be used
+
+        n_clusters : int
+            number of clusters
         
         Returns
         -------
-        stationary_distribution : [float]
-            stationary distribution of bootstrapped msm
+        future : concurrent.futures.Future
+            future of the stationary distribution of bootstrapped msm
 
         traj_idxs : [int]
             indices of trajectories used for bootstrapped msm
         """
-        #get resampled data
-        traj_num = len(self.data)
-        traj_idxs = _np.array([int(idx*traj_num) for idx in _np.random.rand(traj_num)])
-
-	    # get new trajectories
-	    # if different clusters provided, assign new dtrajs
-        if cluster_centers is not None:
-            new_data = [self.data[idx] for idx in traj_idxs]
-            dtrajs = _assign_to_centers(new_data, cluster_centers)
-	    # otherwise resample dtrajs directly
-        else:
-            dtrajs = [self.dtrajs[idx] for idx in traj_idxs]
-            cluster_centers = self.cluster_centers
-        #build msm
-        bootstrap_msm = _bayesian_msm(dtrajs, lag)
-
-        #get stationary distribution
-        stationary_distribution = bootstrap_msm.stationary_distribution
-
-        #add 0 probability for disconnected sets
-        disconnected_sets = bootstrap_msm.connected_sets[1:]
-        if len(disconnected_sets)>0:
-            disconnected_sets = _np.hstack(disconnected_sets)
-            disconnected_sets.sort()
-            for center in disconnected_sets:
-                stationary_distribution = _np.insert(stationary_distribution, center, 0.0)
-        while len(stationary_distribution)!=len(cluster_centers):
-            stationary_distribution = _np.append(stationary_distribution, 0.0)
+        #get resampled dtrajs
+        traj_num = len(dtrajs)
+        traj_idxs = self._rng.integers(traj_num, size=traj_num, dtype=_np.intp)
+        future = executor.submit(_build_bootstrapped_msm, [dtrajs[idx] for idx in traj_idxs], lag, n_clusters)
             
-        return stationary_distribution, traj_idxs
+        return future, traj_idxs
 
     def bootstrapping_convergence(self, state_probabilities, tol=1, last=10):
         """
@@ -1794,30 +1932,22 @@ class MSM:
         converged : bool
             whether bootstrapping has converged
         """
-        # get the last mu values
-        for i in range(state_probabilities.shape[1]):
-            probabilities = state_probabilities[:,i]
-            mu_values = []
-            if len(probabilities)<last:#less than minimum needed to converge
-                return False
-            for i in range(last):
-                last_idx = len(probabilities)-last+i+1
-                try:
-                    A, mu, sigma = self.__fit_gaus(probabilities[:last_idx])
-                    mu_values.append(mu)
-                except RuntimeError:#if cannot fit to a Gaussian curve, then not converged
-                    return False
-            mu_values = _np.array(mu_values)
-            #check if converged
-            av_value = mu_values.mean()
-            diff = abs(mu_values-av_value)
-            converged = all(diff<tol)
-            if not converged:
-                return False
+        if len(state_probabilities)<last:#less than minimum needed to converge
+            return False
+        # the gaussian mu of each prefix is its mean, so get the last mu values
+        # from a running sum instead of refitting every prefix
+        prefix_lengths = _np.arange(len(state_probabilities)-last+1, len(state_probabilities)+1)
+        prefix_sums = _np.cumsum(state_probabilities, axis=0)[prefix_lengths-1]
+        mu_values = prefix_sums/prefix_lengths[:,None]
+        #check if converged, for all states at once
+        #the largest deviation from the mean is at either the maximum or the minimum
+        av_values = mu_values.mean(axis=0)
+        converged = bool((mu_values.max(axis=0)-av_values < tol).all() and (av_values-mu_values.min(axis=0) < tol).all())
 
         return converged
 
-    def bootstrapping(self, n_states, msm=None, lag_time=None, cluster_centers=None, min_iter=10, max_iter=100, tol=1, last=10, verbose=False, overwrite=False):
+    def bootstrapping(self, n_states, msm=None, lag_time=None, cluster_centers=None, min_iter=10, max_iter=100, tol=1, last=10, verbose=False, overwrite=False,
+                      n_jobs=1):
         """
         Compute bootstrapped probabilities of a state until they have converged to a Gaussian distribution or until maximum number
         of iterations have been reached.
@@ -1853,6 +1983,9 @@ class MSM:
 
         overwrite : bool
             whether to overwrite existing probabilities
+
+        n_jobs : int
+            number of bootstrapped msms to build in parallel processes. If None, all cores will be used
         
         Returns
         -------
@@ -1877,43 +2010,68 @@ class MSM:
         if pcca in self.bootstrapping_data and not overwrite:
             # set how many iterations already done
             # to add if more iterations are to be computed
-            i = self.bootstrapping_data[pcca]['probabilities'].shape[0]+1
-            converged = self.bootstrapping_convergence(self.bootstrapping_data[pcca]['probabilities'], tol, last)
+            previous = self.bootstrapping_data[pcca]
+            i = previous['probabilities'].shape[0]+1
+            converged = self.bootstrapping_convergence(previous['probabilities'], tol, last)
         else:
+            previous = {'probabilities': _np.empty((0, n_states)), 'trajectories': []}
             i = 1
-            self.bootstrapping_data[pcca] = {'probabilities': _np.array([]), 'trajectories': []}
             converged = False
+        # flat cluster indices and their state labels, to sum the probabilities of all states at once
+        state_clusters = [_np.asarray(clusters, dtype=int) for clusters in msm.pcca[n_states]]
+        cluster_idxs = _np.concatenate(state_clusters)
+        cluster_states = _np.repeat(_np.arange(n_states), [len(clusters) for clusters in state_clusters])
             
+        # assign data to the cluster centers once for all iterations
+        dtrajs, n_clusters = self.__bootstrap_dtrajs(cluster_centers)
+
+        # preallocate results for all iterations that can be run
+        # probabilities are percentages rounded to 2 decimals, so float32 is enough
+        n_rows = max(i-1, min_iter, max_iter)
+        probabilities = _np.empty((n_rows, n_states), dtype=_np.float32)
+        probabilities[:i-1] = previous['probabilities']
+        trajectories = _np.empty((n_rows, len(dtrajs)), dtype=_np.int32)
+        if i > 1:
+            trajectories[:i-1] = previous['trajectories']
+
         # run bootstrapping
-        while (not converged and i<=max_iter) or i<=min_iter:
-            if verbose:
-                print('%3i/%i'%(i,max_iter), end='\r')
-            # build a bootstrapped msm
-            try: 
-                stationary_distribution, trajectories = self.__build_bootstrapped_msm(lag_time, cluster_centers)
-            except Exception as e: # if msm stationary probabilities too low, an error is thrown - discard those
-                continue
-            # add results
-            probability = _np.array([[round(stationary_distribution[list(state_clusters)].sum()*100, 2) for state_clusters in msm.pcca[n_states]]])
-            if i == 1: # if first iteration
-                self.bootstrapping_data[pcca]['probabilities'] = probability
-            else:
-                self.bootstrapping_data[pcca]['probabilities'] = _np.insert(self.bootstrapping_data[pcca]['probabilities'], len(self.bootstrapping_data[pcca]['probabilities']), probability, axis=0)
-            self.bootstrapping_data[pcca]['trajectories'].append(trajectories)
-            # check for convergence
-            if i >= min_iter:
-                converged = self.bootstrapping_convergence(self.bootstrapping_data[pcca]['probabilities'], tol, last)
-            i+=1
-            #except:
-            #    None
+        # a single worker runs in a thread to avoid copying the data to another process
+        if n_jobs is None:
+            n_jobs = _cpu_count()
+        executor_type = _ThreadPoolExecutor if n_jobs == 1 else _ProcessPoolExecutor
+        with executor_type(max_workers=n_jobs) as executor:
+            while (not converged and i<=max_iter) or i<=min_iter:
+                # build a batch of bootstrapped msms, no larger than the iterations left
+                remaining = (min_iter if converged else max(min_iter, max_iter)) - i + 1
+                jobs = [self.__submit_bootstrapped_msm(executor, dtrajs, lag_time, n_clusters) for _ in range(min(n_jobs, remaining))]
+                for future, traj_idxs in jobs:
+                    if not ((not converged and i<=max_iter) or i<=min_iter):
+                        future.cancel()
+                        continue
+                    if verbose:
+                        print('%3i/%i'%(i,max_iter), end='\r')
+                    try: 
+                        stationary_distribution = future.result()
+                    except Exception as e: # if msm stationary probabilities too low, an error is thrown - discard those
+                        continue
+                    # add results
+                    probabilities[i-1] = _np.round(_np.bincount(cluster_states, weights=stationary_distribution[cluster_idxs], minlength=n_states)*100, 2)
+                    trajectories[i-1] = traj_idxs
+                    # check for convergence
+                    if i >= min_iter:
+                        converged = self.bootstrapping_convergence(probabilities[:i], tol, last)
+                    i+=1
+        self.bootstrapping_data[pcca] = {'probabilities': probabilities[:i-1], 'trajectories': trajectories[:i-1]}
 
         if verbose:
             print(' '*30, end='\r')
+        # keep a states-major copy so that each state is a contiguous row for plotting
+        self.bootstrapping_data[pcca]['probabilities_T'] = _np.ascontiguousarray(self.bootstrapping_data[pcca]['probabilities'].T)
         if pcca not in self.metastable_assignments_bootstrapped or overwrite:
             self.metastable_assignments_bootstrapped[pcca] = {}
-            for j in range(n_states):
-                av_prob = round(_np.array(self.bootstrapping_data[pcca]['probabilities'][:,j]).mean(),2)
-                sdev = round(_np.array(self.bootstrapping_data[pcca]['probabilities'][:,j]).std(), 2)
+            av_probs = _np.round(self.bootstrapping_data[pcca]['probabilities'].mean(axis=0, dtype=_np.float64), 2)
+            sdevs = _np.round(self.bootstrapping_data[pcca]['probabilities'].std(axis=0, dtype=_np.float64), 2)
+            for j, (av_prob, sdev) in enumerate(zip(av_probs.tolist(), sdevs.tolist())):
                 self.metastable_assignments_bootstrapped[pcca][j+1] = [av_prob, sdev, i-1]
                 print(f'State {j+1}: {av_prob}% ± {sdev}% ({i-1} iterations)')
 
@@ -1967,11 +2125,12 @@ class MSM:
             colors = _color_palette(None, n_states)
 
         # get data
-        data = [self.bootstrapping_data[f'{msm.title}, {n_states} states']['probabilities'][:,idx-1] for idx in state_idx]
+        probabilities = self.bootstrapping_data[f'{msm.title}, {n_states} states']['probabilities_T']
+        data = [probabilities[idx-1] for idx in state_idx]
 
         # plot
         fig, ax = _subplots(1)
-        violins = ax.violinplot(data)
+        violins = ax.violinplot(_violin_samples(data))
         # change color
         for violin, color in zip(violins['bodies'], colors):
             violin.set_color(color)
@@ -1,6 +1,25 @@
 from argparse import ArgumentParser
-from ammo.utils._utils import __parse_seeds as _parse_seeds
-from ammo.analysis import compare_trajectories
+
+
+def __optional(value):
+    """Argument type for optional strings, "None" is read as None"""
+    return None if value == 'None' else value
+
+
+def __parse_filter(value):
+    """Argument type for the filter: None, a single number, or a comma separated list of numbers"""
+    if value == 'None':
+        return None
+    filter = [float(val) if '.' in val else int(val) for val in value.replace('[','').replace(']', '').split(',')]
+    return filter if ',' in value else filter[0]
+
+
+def __parse_residues(value):
+    """Argument type for residues: None, or a comma separated list or dash separated range"""
+    if value == 'None':
+        return None
+    from ammo.utils._utils import __parse_seeds as _parse_seeds
+    return _parse_seeds(value)
 
 
 def __main__():
@@ -10,41 +29,19 @@ def __main__():
     parser.add_argument('--ref_traj', required=True, help='reference trajectory file')
     parser.add_argument('--ref_top', required=True, help='reference trajectory topology file')
     parser.add_argument('--n_bins', type=int, default=100, help='number of bins for divergence calculation')
-    parser.add_argument('--div_type', default='KL', help='divergence type. Allowed values: "KL" or "JS"')
-    parser.add_argument('--filter', default=[20,20], help='top number (if int) or fraction (if float) of divergence/hbond frequency difference values to filter, in order of (hbonds, dihedrals); or the divergence/frequency cutoff(s). If None, all will be plotted/visualized')
-    parser.add_argument('--filter_type', default='top', help='way of filtering. Allowed values are "top" (for top n or fraction values) and "cutoff" (for minimum divergence/frequency value(s))')
+    parser.add_argument('--div_type', default='KL', choices=['KL', 'JS'], help='divergence type. Allowed values: "KL" or "JS"')
+    parser.add_argument('--filter', type=__parse_filter, default=[20,20], help='top number (if int) or fraction (if float) of divergence/hbond frequency difference values to filter, in order of (hbonds, dihedrals); or the divergence/frequency cutoff(s). If None, all will be plotted/visualized')
+    parser.add_argument('--filter_type', default='top', choices=['top', 'cutoff'], help='way of filtering. Allowed values are "top" (for top n or fraction values) and "cutoff" (for minimum divergence/frequency value(s))')
     parser.add_argument('--plot', default='plots', help='base file name to save the plots of filtered distributions in the working directory')
-    parser.add_argument('--colors', default=['seagreen', 'indigo'], help='colors for plotting he trajectory and reference values respectively')
-    parser.add_argument('--pymol', default='analysis', help='base filename to save a pymol session in the working directory. If None, no session will be saved')
-    parser.add_argument('--residues', default=None, help='comma separated list or dash separated range of residues to analyse. If None, all residues will be included')
-    parser.add_argument('--workdir', default=None, help='working directory for input/output files. If None, a directory will be created')
+    parser.add_argument('--colors', type=lambda value: value.split(','), default=['seagreen', 'indigo'], help='colors for plotting he trajectory and reference values respectively')
+    parser.add_argument('--pymol', type=__optional, default='analysis', help='base filename to save a pymol session in the working directory. If None, no session will be saved')
+    parser.add_argument('--residues', type=__parse_residues, default=None, help='comma separated list or dash separated range of residues to analyse. If None, all residues will be included')
+    parser.add_argument('--workdir', type=__optional, default=None, help='working directory for input/output files. If None, a directory will be created')
     parser.add_argument('--overwrite', action='store_true', help='overwrite files found in the working trajectory')
     args = parser.parse_args()
 
-    if args.filter == 'None':
-        args.filter = None
-    elif ',' in args.filter:
-        filter = []
-        for val in args.filter.replace('[','').replace(']', '').split(','):
-            if '.' in val:
-                filter.append(float(val))
-            else:
-                filter.append(int(val))
-        args.filter = filter
-
-    if isinstance(args.colors, str):
-        args.colors = args.colors.split(',')
-
-    if args.pymol == 'None':
-        args.pymol = None
-
-    if args.residues == 'None':
-        args.residues = None
-    elif args.residues is not None:
-        args.residues = _parse_seeds(args.residues)
-
-    if args.workdir == 'None':
-        args.workdir = None
+    # heavy imports only once the arguments are valid
+    from ammo.analysis import compare_trajectories
 
     output = compare_trajectories(args.traj, args.ref_traj, args.top, args.ref_top, args.n_bins, args.div_type, args.filter, args.filter_type, args.plot, args.colors, args.pymol, args.residues, args.workdir, args.overwrite)
 
@@ -1,4 +1,3 @@
-from ammo.equilibrium import run_eq_md
 from argparse import ArgumentParser
 
 
@@ -13,6 +12,9 @@ def __main__():
     parser.add_argument('--clean', action='store_true', help='Remove unneeded process files')
     args = parser.parse_args()
 
+    # heavy imports only once the arguments are valid
+    from ammo.equilibrium import run_eq_md
+
     run_eq_md(args.duration, args.topology, args.coordinates, args.output, args.report, args.workdir, args.clean)
     return None
 
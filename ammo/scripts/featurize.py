@@ -1,6 +1,4 @@
-import numpy as np
 from argparse import ArgumentParser
-from ammo.analysis import featurize
 
 
 def __main__():
@@ -14,6 +12,10 @@ def __main__():
     parser.add_argument('--shared', default='!@/H', help='mask for atoms used for aligning the RMSD reference. Default: "!@/H"')
     args = parser.parse_args()
 
+    # heavy imports only once the arguments are valid
+    import numpy as np
+    from ammo.analysis import featurize
+
     featurized = featurize(args.trajectory, args.topology, args.feature, args.mask, args.reference, args.shared)
     np.savetxt(args.output, featurized)
     
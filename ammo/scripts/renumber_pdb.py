@@ -1,5 +1,4 @@
 from argparse import ArgumentParser
-from ammo.utils import renumber_pdb
 
 
 def __main__():
@@ -11,6 +10,9 @@ def __main__():
     parser.add_argument('--offset', type=int, default=0, help='Residue difference between the input and reference. Default: 0')
     args = parser.parse_args()
 
+    # heavy imports only once the arguments are valid
+    from ammo.utils import renumber_pdb
+
     if ',' in args.reference:
         args.reference = args.reference.split(',')
     
@@ -1,9 +1,11 @@
 import os
 from argparse import ArgumentParser
-from ammo.equilibrium import run_eq_md
 
 
 def run_seeded_md(folder, snapshot, duration, report=5000, clean=False):
+    # imported here so that argument errors are reported without loading BioSimSpace
+    from ammo.equilibrium import run_eq_md
+
     os.chdir(folder)
     if not os.path.exists(f'snapshot_{snapshot}'):
         os.mkdir(f'snapshot_{snapshot}')
@@ -1,47 +1,33 @@
 from ast import literal_eval
 from argparse import ArgumentParser
-from ammo.setup import setup_system
 
 
-def __clean_args(args):
-    # change protocol input into a list
-    args.protocol = literal_eval(args.protocol)
+def __optional(value):
+    """Argument type for optional strings, "None" is read as None"""
+    return None if value == 'None' else value
 
-    # fix charges is given
-    if args.charges is not None:
-        args.charges = literal_eval(args.charges)
 
-    # fix extra parameters is given
-    if args.parameters == 'None':
-        args.parameters = None
-    elif args.parameters is not None:
-        args.parameters = args.parameters.split(',')
-
-    # topology None
-    if args.topology == 'None':
-        args.topology = None
-
-    # fix if already solvated
-    if args.solvation == 'None':
-        args.solvation = None
-
-    return args
+def __optional_list(value):
+    """Argument type for optional comma separated lists, "None" is read as None"""
+    return None if value == 'None' else value.split(',')
 
 
 def __main__():
     parser = ArgumentParser(description='General system setup: parameterisation, solvation, minimisation, heating, and equilibration.')
     parser.add_argument('--input', required=True, type=str, help='System PDB file')
-    parser.add_argument('--protocol', required=True, type=str, help='Comma separated list of minimisation steps, heating duration in ps, '
+    parser.add_argument('--protocol', required=True, type=literal_eval, help='Comma separated list of minimisation steps, heating duration in ps, '
                                                      'and equilibration duration in ps')
     parser.add_argument('--engine', type=str, default='GROMACS', help='Simulation engine supported by BioSimSpace. Default: "GROMACS"')
-    parser.add_argument('--charges', type=str, help='Ligand charges in the order they appear in the input PDB, '
+    parser.add_argument('--charges', type=literal_eval, help='Ligand charges in the order they appear in the input PDB, '
                                                     'comma separated')
-    parser.add_argument('--parameters', type=str, help='any additional parameter arguments to give LeAP separated by comma')
-    parser.add_argument('--topology', type=str, help='Dry topology of system. If provided will be used instead of '
+    parser.add_argument('--parameters', type=__optional_list, help='any additional parameter arguments to give LeAP separated by comma')
+    parser.add_argument('--topology', type=__optional, help='Dry topology of system. If provided will be used instead of '
                                                      're-parameterising')
-    parser.add_argument('--solvation', default='shell,10', help='Way to solvate the system, e.g. 10 A shell is "shell,10", while a 15 A box in all dimensions is "box,15,15,15" (x, y, and z respectively). If None, the system will be treated as already solvated.')
+    parser.add_argument('--solvation', type=__optional, default='shell,10', help='Way to solvate the system, e.g. 10 A shell is "shell,10", while a 15 A box in all dimensions is "box,15,15,15" (x, y, and z respectively). If None, the system will be treated as already solvated.')
     args = parser.parse_args()
-    args = __clean_args(args)
+
+    # heavy imports only once the arguments are valid
+    from ammo.setup import setup_system
 
     setup_system(args.input, args.protocol, args.engine, args.charges, args.parameters, args.topology, args.solvation)
 
@@ -1 +1 @@
-from ._steering import run_smd
+from ._steering import run_smd, run_smd_batch
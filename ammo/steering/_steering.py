@@ -1,14 +1,28 @@
 import os
+import re
+import operator
 import subprocess
 import BioSimSpace as BSS
 import pytraj as pt
-from shutil import move
-from numpy import array
+from shutil import move, which
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Queue
 from ammo.utils import get_dry_trajectory
 from ammo.utils._utils import __add_restraint as _add_restraint
 from time import sleep
 
 
+# plumed keywords shared by the parsers
+_RESTRAINT = 'MOVINGRESTRAINT'
+_INITIAL = 'initial'
+
+# simple arithmetic on the initial CV value, e.g. "initial/2" or "2*initial"
+_OPERAND = rf'({_INITIAL}|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)'
+_OPERATION = re.compile(rf'^\s*{_OPERAND}\s*([*/+-])\s*{_OPERAND}\s*$')
+_OPERATORS = {'/': operator.truediv, '*': operator.mul, '+': operator.add, '-': operator.sub}
+
+
 def __load_input(input):
     # first check if file
     if isinstance(input, str):
@@ -24,30 +38,48 @@ def __load_input(input):
     return plumed
 
 
-def __get_duration(plumed):
-    """Find total number of steps in the plumed file"""
-    reading_steps = False
+def __find_restraint(plumed):
+    """Find the line range of the MOVINGRESTRAINT block, so that each part of the file is only parsed once"""
+    start = end = len(plumed)
+    for i, line in enumerate(plumed):
+        if _RESTRAINT in line:
+            if start == len(plumed):
+                start = i
+            # closing line of the block
+            else:
+                end = i
+                break
+    return start, end
+
+
+def __get_duration(restraint):
+    """Find total number of steps in the MOVINGRESTRAINT block"""
     duration = 0
     steering_duration = 0
-    for line in plumed:
-        if 'MOVINGRESTRAINT' in line and not reading_steps:
-            reading_steps = True
-        elif 'MOVINGRESTRAINT' in line and reading_steps:
-            reading_steps = False
-            break
-        if 'STEP' in line and reading_steps:
-            parts = line.split()
-            for part in parts:
-                if 'STEP' in part:
-                    step_duration = int(part.split('=')[1])
+    for line in restraint:
+        if 'STEP' in line:
+            for part in line.split():
+                key, _, value = part.partition('=')
+                if key.startswith('STEP'):
+                    step_duration = int(value)
                     duration = max(duration, step_duration)
-                if 'KAPPA' in part:
-                    step_forces = [float(val) for val in part.split('=')[1].split(',')]
-                    if not all(array(step_forces) == 0.0):
+                elif key.startswith('KAPPA'):
+                    step_forces = [float(val) for val in value.split(',')]
+                    if any(force != 0.0 for force in step_forces):
                         steering_duration = max(step_duration, steering_duration)
     return duration, steering_duration
 
 
+@lru_cache(maxsize=None)
+def __find_pmemd_cuda():
+    """Find the CUDA version of pmemd once per session, preferring the one in the AMBER installation"""
+    amber_bin = f'{os.environ["AMBERHOME"]}/bin' if 'AMBERHOME' in os.environ else None
+    exe = which('pmemd.cuda', path=amber_bin) or which('pmemd.cuda')
+    if exe is None:
+        raise LookupError('pmemd.cuda not found in $AMBERHOME/bin or PATH. It is required to run steered MD with AMBER')
+    return exe
+
+
 def __create_process(system, duration, engine, workdir):
     # create a simple distance CV
     cv = BSS.Metadynamics.CollectiveVariable.Distance(1, 2)
@@ -58,125 +90,143 @@ def __create_process(system, duration, engine, workdir):
     protocol = BSS.Protocol.Steering(cv, schedule, restraints, runtime=schedule[-1], report_interval=2500, restart_interval=2500)
     
     # create the process
-    workdir = os.path.abspath(workdir)
+    if workdir is not None:
+        workdir = os.path.abspath(workdir)
     if engine == 'AMBER':
-        process = BSS.Process.Amber(system, protocol, exe=f'{os.environ["AMBERHOME"]}/bin/pmemd.cuda', work_dir=workdir) # specify using pmemd.cuda
+        process = BSS.Process.Amber(system, protocol, exe=__find_pmemd_cuda(), work_dir=workdir) # specify using pmemd.cuda
     else:
         process = BSS.Process.createProcess(system, protocol, engine, work_dir=workdir)
-    
-    # go to the process workdir
-    os.chdir(workdir)
 
     return protocol, process
 
 
-def __edit_masks(plumed, system, pytraj_system, suffix):
+def __edit_masks(plumed, restraint_start, system, pytraj_topology, suffix, workdir, needs_initial=True):
     rmsd_count = 0
-    # loop over plumed input and replace masks with atoms
-    # and "initial" values with actual system values
-    for i, line in enumerate(plumed):
+    # loop over plumed input before the steering part and replace masks with atoms
+    for i, line in enumerate(plumed[:restraint_start]):
         # replace mask with atom indices
         if 'ATOMS=' in line:
-            new_line = __parse_masks(line, pytraj_system)
+            new_line = __parse_masks(line, pytraj_topology)
             plumed[i] = new_line
         # write reference
         elif 'REFERENCE=' in line:
             rmsd_count += 1
-            new_line = __write_reference(line, system, rmsd_count, suffix)
+            new_line = __write_reference(line, system, rmsd_count, suffix, workdir)
             plumed[i] = new_line
-        # reach steering part of the file
-        elif 'MOVINGRESTRAINT' in line:
-            # write plumed file with only the CVs
-            with open('plumed.dat', 'w') as file:
-                file.writelines(plumed[:i]+['PRINT ARG=* FILE=initial.dat\n'])
-            # run plumed driver to find the initial values
-            subprocess.run(['plumed', 'driver', '--mf_pdb', 'input.pdb'])
-            break
+
+    # reach steering part of the file, only needed if "initial" values are used
+    if restraint_start < len(plumed) and needs_initial:
+        # write plumed file with only the CVs
+        with open(f'{workdir}/plumed.dat', 'w') as file:
+            file.write(''.join(plumed[:restraint_start]) + 'PRINT ARG=* FILE=initial.dat\n')
+        # run plumed driver to find the initial values
+        subprocess.run(['plumed', 'driver', '--mf_pdb', 'input.pdb'], cwd=workdir)
 
     return plumed
 
 
-def __parse_masks(line, system):
-    """Parse masks to return atom indices for the system"""
+def __parse_masks(line, topology):
+    """Parse masks to return atom indices for the system topology"""
     parts = line.replace('\n', '').split() # remove newline character
 
     for i, part in enumerate(parts):
-        if 'ATOMS' in part:
-            mask = part.split('=')[1]
-            atoms = system.topology.select(mask)+1 # add 1 since pytraj.Topology.select() indexes from 0 but PLUMED does from 1
-            parts[i] = f'ATOMS={",".join([str(idx) for idx in atoms])}'
+        key, _, mask = part.partition('=')
+        if key.startswith('ATOMS'):
+            atoms = topology.select(mask)+1 # add 1 since pytraj.Topology.select() indexes from 0 but PLUMED does from 1
+            parts[i] = f'{key}={",".join(atoms.astype(str))}'
     
     new_line = ' '.join(parts) + '\n'
 
     return new_line
 
 
-def __write_reference(line, system, count, suffix):
-    """Write a correctly ordered RMSD reference file"""
-    parts = line.replace('\n', '').split() # remove newline character
+@lru_cache(maxsize=32)
+def __load_reference_atoms(reference, modified, mask):
+    """Atom indices of a mask in an RMSD reference, cached across steps using the same reference"""
+    return tuple(pt.load(reference).topology.select(mask).tolist())
 
-    for i, part in enumerate(parts):
+
+@lru_cache(maxsize=32)
+def __load_reference_molecule(reference, modified):
+    """RMSD reference molecule, cached across steps using the same reference"""
+    return BSS.IO.readMolecules(reference).getMolecule(0)
+
+
+def __write_reference(line, system, count, suffix, workdir):
+    """Write a correctly ordered RMSD reference file"""
+    parts = []
+    for part in line.split():
+        key, _, value = part.partition('=')
         # parse atom mask
-        if 'REFERENCE' in part:
-            mask = part.split('=')[1]
-            parts[i] = f'REFERENCE=reference{suffix}_{count}.pdb'
-        # parse file location
-        elif 'FILE' in part:
-            reference = part.split('=')[1]
+        if key == 'REFERENCE':
+            mask = value
+            parts.append(f'REFERENCE=reference{suffix}_{count}.pdb')
+        # parse file location, which is not kept in the line
+        elif key == 'FILE':
+            reference = value
             if not os.path.exists(reference):
                 raise ValueError(f'RMSD reference {reference} not found.')
-            del parts[i]
+        else:
+            parts.append(part)
     
-    reference_atoms = pt.load(reference).topology.select(mask).tolist() # do not need to add 1 because indices will be handled by BSS
-    reference = BSS.IO.readMolecules(reference).getMolecule(0)
+    # the modification time is part of the key so that edited references are reloaded
+    reference, modified = os.path.abspath(reference), os.path.getmtime(reference)
+    reference_atoms = list(__load_reference_atoms(reference, modified, mask)) # do not need to add 1 because indices will be handled by BSS
+    reference = __load_reference_molecule(reference, modified)
 
     cv = BSS.Metadynamics.CollectiveVariable.RMSD(system, reference, reference_atoms, 0)
-    with open(f'reference{suffix}_{count}.pdb', 'w') as file:
-        file.writelines([line+'\n' for line in cv.getReferencePDB()])
+    with open(f'{workdir}/reference{suffix}_{count}.pdb', 'w') as file:
+        file.write('\n'.join(cv.getReferencePDB()) + '\n')
 
     new_line = ' '.join(parts) + '\n'
 
     return new_line
 
 
-def __edit_values(plumed):
+def __read_first_and_last(file_name, block=4096):
+    """Read the first and last lines of a file without reading the lines in between"""
+    with open(file_name, 'rb') as file:
+        first = file.readline()
+        # read increasingly large blocks from the end until a full last line is found
+        size = file.seek(0, os.SEEK_END)
+        while True:
+            file.seek(max(0, size-block))
+            tail = file.read().rstrip()
+            if b'\n' in tail or block >= size:
+                break
+            block *= 2
+    last = tail.rsplit(b'\n', 1)[-1]
+
+    return first.decode(), last.decode()
+
+
+def __edit_values(plumed, restraint_start, restraint_end, workdir):
     # read in the initial values
-    with open('initial.dat', 'r') as file:
-        initial_contents = file.readlines()
-    all_labels = initial_contents[0].split()[3:]
-    all_values = [float(val) for val in initial_contents[-1].split()[1:]]
-    values = {}
-    for i in range(len(all_labels)):
-        values[all_labels[i]] = all_values[i]
-
-    # go over plumed file
-    reading_restraint = False
-    for i, line in enumerate(plumed):
-        # find MOVINGRESTRAINT part
-        if 'MOVINGRESTRAINT' in line and not reading_restraint:
-            reading_restraint = True
-        # reach end of restraint
-        elif 'MOVINRESTRAINT' in line and reading_restraint:
-            reading_restraint = False
-            break
+    header, last_line = __read_first_and_last(f'{workdir}/initial.dat')
+    values = dict(zip(header.split()[3:], map(float, last_line.split()[1:])))
+
+    # go over the MOVINGRESTRAINT part of the plumed file
+    for i in range(restraint_start, restraint_end):
+        line = plumed[i]
         # find which CVs are used for steering
-        if 'ARG=' in line and reading_restraint:
-            parts = line.replace('\n', '').split()
-            for part in parts:
-                if 'ARG=' in part:
-                    labels = part.replace('ARG=', '').split(',')
+        if 'ARG=' in line:
+            for part in line.split():
+                key, _, value = part.partition('=')
+                if key == 'ARG':
+                    labels = value.split(',')
         # find step definitions
         # and check if there are "initial"
         # values that need to be replaces
-        elif 'STEP' in line and 'initial' in line and reading_restraint:
-            parts = line.replace('\n', '').split()
+        elif 'STEP' in line and _INITIAL in line:
+            parts = line.split()
             for j, part in enumerate(parts):
-                if 'AT' in part and 'initial' in part:
-                    step_values = part.split('=')[1].split(',')
+                key, _, value = part.partition('=')
+                if key.startswith('AT') and _INITIAL in value:
+                    step_values = value.split(',')
                     for k, val in enumerate(step_values):
-                        if 'initial' in val:
+                        if _INITIAL in val:
                             step_values[k] = str(__parse_operation(val, values[labels[k]]))
-                    parts[j] = f'{part.split("=")[0]}={",".join(step_values)}'
+                    parts[j] = f'{key}={",".join(step_values)}'
             plumed[i] = '  ' + ' '.join(parts) + '\n'
     
     return plumed
@@ -184,25 +234,25 @@ def __edit_values(plumed):
 
 def __parse_operation(expression, initial):
     """Parse a simple expression involving the initial CV value"""
-    expression = expression.replace('initial', str(initial))
-    if '/' in expression:
-        components = [float(component) for component in expression.split('/')]
-        value = components[0]/components[1]
-    elif '*' in expression:
-        components = [float(component) for component in expression.split('*')]
-        value = components[0]*components[1]
-    elif '+' in expression:
-        components = [float(component) for component in expression.split('+')]
-        value = components[0]+components[1]
-    elif '-' in expression:
-        components = [float(component) for component in expression.split('-')]
-        value = components[0]-components[1]
-    else:
-        value = initial
-    return value
+    match = _OPERATION.match(expression)
+    if match is None:
+        return initial
+    left, op, right = match.groups()
+    left = initial if left == _INITIAL else float(left)
+    right = initial if right == _INITIAL else float(right)
+    return _OPERATORS[op](left, right)
+
+
+def __fast_move(source, destination):
+    """Move a file with a rename if on the same filesystem, otherwise copy it over"""
+    try:
+        os.replace(source, destination)
+    except OSError:
+        move(source, destination)
+    return None
 
 
-def run_smd(topology, coordinates, input, engine='AMBER', workdir='.', suffix=None, restraint=None):
+def run_smd(topology, coordinates, input, engine='AMBER', workdir='.', suffix=None, restraint=None, poll_interval=None):
     """
     Run a steered MD simulation with AMBER or GROMACS and PLUMED.
 
@@ -222,6 +272,8 @@ def run_smd(topology, coordinates, input, engine='AMBER', workdir='.', suffix=No
         a suffix to add to the output of the simulation, e.g. "steering_1.nc" or "steering_1.dat". For cases when the steering is done in more than one step. If None, nothing will be added
     restraint : str
         a pseudo flat bottom restraint file that will be used during the steering (currently only available for AMBER), either as the input itself, or a path to a file. Instead of atom indices, AMBER masks can be used
+    poll_interval : float
+        seconds between checks whether the simulation has finished. If None, the BioSimSpace blocking wait is used
 
     Returns
     -------
@@ -230,17 +282,20 @@ def run_smd(topology, coordinates, input, engine='AMBER', workdir='.', suffix=No
     """
     # load system files
     system = BSS.IO.readMolecules([topology, coordinates])
-    pytraj_system = pt.load(coordinates, top=topology) # using pytraj system for searching and some initial value computing
+    pytraj_topology = pt.load_topology(topology) # using pytraj topology for searching, coordinates are not needed
 
     # load input
     plumed = __load_input(input)
-    duration, steering_duration = __get_duration(plumed)
+    restraint_start, restraint_end = __find_restraint(plumed)
+    duration, steering_duration = __get_duration(plumed[restraint_start:restraint_end])
 
     # create protocol and process
     protocol, process = __create_process(system, duration, engine, workdir)
-    # now in process workdir
+    # process inputs are written to the process workdir, outputs to the given workdir
+    process_dir = process.workDir()
+    output_dir = os.getcwd() if workdir is None else os.path.abspath(workdir)
     # write input as PDB
-    BSS.IO.saveMolecules('input', system, 'pdb')
+    BSS.IO.saveMolecules(f'{process_dir}/input', system, 'pdb')
 
     # get suffix
     if suffix is None:
@@ -249,43 +304,108 @@ def run_smd(topology, coordinates, input, engine='AMBER', workdir='.', suffix=No
         suffix = f'_{suffix}'
 
     # fix plumed
-    plumed = __edit_masks(plumed, system, pytraj_system, suffix)
-    plumed = __edit_values(plumed)
-    with open('plumed.dat', 'w') as file:
-        file.writelines(plumed)
+    needs_initial = _INITIAL in ''.join(plumed[restraint_start:restraint_end])
+    plumed = __edit_masks(plumed, restraint_start, system, pytraj_topology, suffix, process_dir, needs_initial)
+    if needs_initial:
+        plumed = __edit_values(plumed, restraint_start, restraint_end, process_dir)
+    with open(f'{process_dir}/plumed.dat', 'w') as file:
+        file.write(''.join(plumed))
 
     # add restraints if needed
     if restraint is not None:
-        _add_restraint(process, restraint, pytraj_system)
+        _add_restraint(process, restraint, pytraj_topology)
 
     # run process
     process.start()
-    print(f'Process running in {process.workDir}')
-    process.wait()
+    print(f'Process running in {process_dir}')
+    if poll_interval is None:
+        process.wait()
+    else:
+        while process.isRunning():
+            sleep(poll_interval)
 
     # copy output
     if engine.upper() == 'AMBER':
         trajectory = '.nc'
-    elif engine.uper() == 'GROMACS':
+    elif engine.upper() == 'GROMACS':
         trajectory = ''
 
     # get last steering frame rather than last simulation frame as the restart
-    frame = pt.load(f'{process.workDir()}/{engine.lower()}{trajectory}', top=topology, frame_indices=[steering_duration//protocol.getRestartInterval()])
-    pt.save(f'steering{suffix}.rst7', frame)
-    os.rename(f'steering{suffix}.rst7.1', f'steering{suffix}.rst7')
+    frame = pt.load(f'{process_dir}/{engine.lower()}{trajectory}', top=topology, frame_indices=[steering_duration//protocol.getRestartInterval()])
+    pt.save(f'{output_dir}/steering{suffix}.rst7', frame)
+    os.rename(f'{output_dir}/steering{suffix}.rst7.1', f'{output_dir}/steering{suffix}.rst7')
 
     to_copy = {f'{engine.lower()}{trajectory}': f'steering{suffix}{trajectory}', 'plumed.dat': f'plumed{suffix}.dat', 'steering.dat': f'steering{suffix}.dat', f'{engine.lower()}.out': f'steering{suffix}.out', f'{engine.lower()}.cfg': f'steering{suffix}.in'}
 
-    reference = [file for file in os.listdir(process.workDir()) if 'reference' in file]
-    for i in range(len(reference)):
-        to_copy[f'reference_{i+1}.pdb'] = f'reference_{i+1}.pdb'
+    # list the process directory once
+    with os.scandir(process_dir) as entries:
+        files = {entry.name: entry.path for entry in entries if entry.is_file()}
+    to_copy.update({file: file for file in files if file.startswith('reference')})
     for file in to_copy:
-        move(f'{process.workDir()}/{file}', to_copy[file])
+        if file in files:
+            __fast_move(files[file], f'{output_dir}/{to_copy[file]}')
 
     # remove unneeded process files
-    os.remove('amber.*')
+    for file in files:
+        if file.startswith('amber.') and file not in to_copy:
+            os.remove(files[file])
 
     # dry trajectory
-    get_dry_trajectory(topology, f'steering{suffix}.nc', f'steering{suffix}_dry.nc')
+    get_dry_trajectory(topology, f'{output_dir}/steering{suffix}.nc', f'{output_dir}/steering{suffix}_dry.nc')
+
+    return None
+
+
+def __set_gpu(gpus):
+    """Pin a worker process to one of the free GPUs"""
+    os.environ['CUDA_VISIBLE_DEVICES'] = str(gpus.get())
+    return None
+
+
+def __absolute_paths(job):
+    """Make the paths of a job absolute, so that it does not depend on the working directory of the worker"""
+    job = dict(job)
+    for key in ['topology', 'coordinates', 'input', 'restraint']:
+        if isinstance(job.get(key), str) and os.path.exists(job[key]):
+            job[key] = os.path.abspath(job[key])
+    if job.get('workdir') is not None:
+        job['workdir'] = os.path.abspath(job['workdir'])
+    return job
+
+
+def run_smd_batch(jobs, gpus=(0,)):
+    """
+    Run several steered MD simulations in parallel, one per GPU at a time.
+
+    Parameters
+    ----------
+    jobs : [dict]
+        keyword arguments for run_smd for each simulation, e.g. {'topology': 'system.prm7', 'coordinates': 'system.rst7', 'input': 'steering.dat', 'workdir': 'ligand_1'}.
+        Every job needs its own "workdir", simulations sharing one would overwrite each other's files
+    gpus : [int]
+        indices of the GPUs to use. Each worker process is pinned to one of them through CUDA_VISIBLE_DEVICES
+
+    Returns
+    -------
+    None
+    """
+    # check that simulations running at the same time cannot share files
+    jobs = [__absolute_paths(job) for job in jobs]
+    workdirs = [job.get('workdir') for job in jobs]
+    if None in workdirs:
+        raise ValueError('Each job needs a "workdir" when running simulations in parallel')
+    if len(set(workdirs)) < len(workdirs):
+        raise ValueError('Each job needs a different "workdir" when running simulations in parallel')
+
+    # each worker takes one GPU from the queue when it starts
+    free_gpus = Queue()
+    for gpu in gpus:
+        free_gpus.put(gpu)
+
+    with ProcessPoolExecutor(max_workers=len(gpus), initializer=__set_gpu, initargs=(free_gpus,)) as executor:
+        futures = [executor.submit(run_smd, **job) for job in jobs]
+        # raise any errors as soon as they happen
+        for future in as_completed(futures):
+            future.result()
 
     return None
@@ -1 +1 @@
-from ._utils import get_dry_trajectory, renumber_pdb
+from ._utils import get_dry_trajectory, get_dry_trajectories, renumber_pdb
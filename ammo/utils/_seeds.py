@@ -0,0 +1,29 @@
+"""Seed index parsing shared with the command line tools. Standard library imports only,
+bin/_settings.py loads this file with an interpreter that may lack the simulation dependencies"""
+
+import re
+
+
+# seed indices given as "1", "1-5" or "1,3,5"
+_SEED_RE = re.compile(r'^(\d+)(?:-(\d+)|((?:,\d+)+))?$')
+
+
+def __parse_seeds(seeds):
+    if isinstance(seeds, (list, tuple)):
+        # seed lists are built internally, so the indices are not type checked
+        return list(seeds)
+    elif isinstance(seeds, str):
+        match = _SEED_RE.match(''.join(seeds.split())) # allow spaces, e.g. "1 - 5" or "1, 3, 5"
+        if match is None:
+            raise ValueError(f'Seeds have to be given as "1", "1-5" or "1,3,5". Seeds provided: {seeds}')
+        first, last, others = match.groups()
+        if last is not None:
+            return list(range(int(first), int(last)+1))
+        elif others is not None:
+            return [int(first)] + [int(idx) for idx in others[1:].split(',')]
+        else:
+            return [int(first)]
+    elif isinstance(seeds, int):
+        return [seeds]
+    else:
+        raise TypeError('Seeds must be of type str, int, list or tuple')
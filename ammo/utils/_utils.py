@@ -1,16 +1,65 @@
-"""General useful functions"""
+"""General useful functions. numpy, pytraj and BioSimSpace are imported where used, so that
+importing ammo.utils stays cheap"""
 
 import os
-from random import choice
-from string import ascii_lowercase, digits
+import re
 import subprocess
-import numpy as np
-from pytraj import load, Trajectory, save
-from BioSimSpace.Process import Amber
+from functools import lru_cache
+from tempfile import NamedTemporaryFile
+from ._seeds import __parse_seeds
+
+
+# seconds per time unit, and how units are displayed
+_TIME_FACTOR = {'fs': 1e-15, 'ps': 1e-12, 'ns': 1e-9, 'us': 1e-6, 'ms': 1e-3, 's': 1.0}
+_TIME_LABEL = {unit: unit.replace('u', 'μ') for unit in _TIME_FACTOR}
+
+# AMBER config lines turning on NMR restraints read from the RST file
+_RESTRAINT_TAIL = ("  nmropt=1,",
+                   " /",
+                   " &wt type='REST', istep1=0,istep2=3000,value1=0.1,value2=1.0,  /",
+                   " &wt type='REST', istep1=3000,istep2=0,value1=1.0,value2=1.0  /",
+                   "&wt type='END'  /",
+                   "DISANG=RST")
+
+# single atom masks, e.g. ":12@CA", which can be looked up without a mask parse
+_ATOM_MASK_RE = re.compile(r'^:(\d+)@([^\s,:@&|!<>*=]+)$')
 
 
 def __random_name(n_chars=10):
-    return "".join(choice(ascii_lowercase + digits) for _ in range(n_chars))
+    return os.urandom((n_chars+1)//2).hex()[:n_chars]
+
+
+def __map_reference_atoms(topology):
+    """Map (residue number, atom name) to the first matching atom index, residue numbers start at 1 as in AMBER masks"""
+    reference_atoms = {}
+    for idx, atom in enumerate(topology.atoms):
+        reference_atoms.setdefault((atom.resid+1, atom.name), idx)
+    return reference_atoms
+
+
+def __map_restraint_atoms(topology):
+    """Map (residue number, atom name) to the atom index, with None for pairs matching more than one atom"""
+    restraint_atoms = {}
+    for idx, atom in enumerate(topology.atoms):
+        key = (atom.resid+1, atom.name)
+        restraint_atoms[key] = None if key in restraint_atoms else idx
+    return restraint_atoms
+
+
+@lru_cache(maxsize=8)
+def __load_reference(files, modified):
+    """Reference trajectory and its atom map, cached across calls using the same reference files"""
+    from pytraj import load
+    if len(files) == 1:
+        reference = load(files[0])
+    else:
+        for file in files:
+            if file.endswith('.prm7') or file.endswith('.parm7') or file.endswith('.top'):
+                topology = file
+            else:
+                coordinates = file
+        reference = load(coordinates, top=topology)
+    return reference, __map_reference_atoms(reference.top)
 
 
 def renumber_pdb(input, reference, output=None, matching='warn', offset=0):
@@ -39,21 +88,19 @@ def renumber_pdb(input, reference, output=None, matching='warn', offset=0):
     new_pdb : [str]
         renumbered PDB file
     """
-    # load reference
+    import numpy as np
+    from pytraj import Trajectory
+
+    # load reference, files are cached by path and modification time
     if isinstance(reference, Trajectory):
-        return reference
-    elif isinstance(reference, str):
-        if not reference.endswith('.pdb'):
+        reference_atoms = __map_reference_atoms(reference.top)
+    elif isinstance(reference, (str, list)):
+        # absolute paths, so that the same relative name in another directory is not served from the cache
+        files = tuple(os.path.abspath(file) for file in ([reference] if isinstance(reference, str) else reference))
+        if len(files) == 1 and not files[0].endswith('.pdb'):
             raise AssertionError('If only a single file provided for reference, it must be of PDB format')
-        else:
-            reference = load(reference)
-    elif isinstance(reference, list):
-        for file in reference:
-            if file.endswith('.prm7') or file.endswith('.parm7') or file.endswith('.top'):
-                topology = file
-            else:
-                coordinates = file
-        reference = load(coordinates, top=topology)
+        modified = tuple(os.path.getmtime(file) for file in files)
+        reference, reference_atoms = __load_reference(files, modified)
     else:
         raise TypeError('Unsupported reference files')
 
@@ -61,24 +108,37 @@ def renumber_pdb(input, reference, output=None, matching='warn', offset=0):
     with open(input, 'r') as file:
         pdb = file.readlines()
 
-    # look for PDB atoms in reference
-    new_pdb_unsorted = {}
+    # parse the fixed width atom columns of all lines at once
+    columns = np.array(pdb, dtype='U80')
+    characters = columns.view('U1').reshape(-1, 80)
+    record_4 = np.ascontiguousarray(characters[:, :4]).view('U4').ravel()
+    record_6 = np.ascontiguousarray(characters[:, :6]).view('U6').ravel()
+    is_atom = (record_4 == 'ATOM') | (record_6 == 'HETATM')
+    characters = characters[is_atom]
+    at_idxs = np.ascontiguousarray(characters[:, 6:11]).view('U5').ravel().astype(int)
+    at_names = np.char.strip(np.ascontiguousarray(characters[:, 12:16]).view('U4').ravel())
+    res_idxs = np.ascontiguousarray(characters[:, 22:26]).view('U4').ravel().astype(int)
+    atom_fields = zip(res_idxs.tolist(), at_names.tolist(), at_idxs.tolist())
+
+    # look for PDB atoms in reference, placing each at its new index. Unmatched atoms keep
+    # their original index, so the slots have to cover those as well
+    n_slots = max(reference.top.n_atoms, int(at_idxs.max()) if at_idxs.size else 0) + 1
+    new_pdb_unsorted = [None] * n_slots
     unmatched = []
-    for line in pdb:
-        if line.startswith('ATOM') or line.startswith('HETATM'):
-            res_idx = int(line[22:26].strip())
-            at_name = line[12:16]
-            at_idx = int(line[6:11].strip())
-            search = reference.top.select(f':{res_idx+offset}@{at_name}')
-            if len(search) == 0:
+    for line, atom_line in zip(pdb, is_atom.tolist()):
+        if atom_line:
+            res_idx, at_name, at_idx = next(atom_fields)
+            match = reference_atoms.get((res_idx+offset, at_name))
+            if match is None:
                 unmatched.append(f':{res_idx}@{at_name}')
-                new_pdb_unsorted[at_idx] = line
+                new_pdb_unsorted[at_idx] = [line]
                 last_idx = at_idx
             else:
-                new_pdb_unsorted[search[0]+1] = line[:6] + '%5s'%(search[0]+1) + line[11:]
-                last_idx = search[0]+1
+                new_pdb_unsorted[match+1] = [line[:6] + '%5s'%(match+1) + line[11:]]
+                last_idx = match+1
         else:
-            new_pdb_unsorted[last_idx] = new_pdb_unsorted[last_idx]+line
+            # keep lines following an atom (TER, ANISOU, ...) with that atom
+            new_pdb_unsorted[last_idx].append(line)
     
     # deal with unmatched atoms
     if len(unmatched) > 0:
@@ -87,13 +147,13 @@ def renumber_pdb(input, reference, output=None, matching='warn', offset=0):
         elif matching == 'error':
             raise ValueError(f'residues {",".join(unmatched)} in system were not found in reference')
     
-    # sort atoms by new index
-    new_pdb = [new_pdb_unsorted[idx] for idx in sorted(new_pdb_unsorted)]
+    # drop empty slots, atoms are already in order of new index
+    new_pdb = [''.join(lines) for lines in new_pdb_unsorted if lines is not None]
 
     # write output
     if output is not None:
-        with open(output, 'w') as file:
-            file.writelines(new_pdb)
+        with open(output, 'w', buffering=1<<20) as file:
+            file.write(''.join(new_pdb))
 
     return new_pdb
 
@@ -112,6 +172,23 @@ def get_dry_trajectory(topology, trajectory, output):
     output : str
         where to save the dry output
 
+    Return
+    ------
+    None
+    """
+    get_dry_trajectories([(topology, trajectory, output)])
+
+    return None
+
+
+def get_dry_trajectories(jobs):
+    """Dry several trajectories with a single cpptraj run
+
+    Parameters
+    ----------
+    jobs : [(str, str, str)]
+        topology, trajectory and output paths for each trajectory to dry
+
     Return
     ------
     None
@@ -119,38 +196,22 @@ def get_dry_trajectory(topology, trajectory, output):
     to_strip = ':WAT,:SOL,:HOH,:NA,:CL,:Na+,:Cl-,:CLA,:POT,:SOD'
     cpptraj_file = f'cpptraj_{__random_name()}.in'
 
+    # one block per trajectory, cleared before the next one is read
+    blocks = [f'parm {topology}\n'
+              f'trajin {trajectory}\n'
+              f'strip {to_strip}\n'
+              f'trajout {output}\n'
+               'go\n'
+              for topology, trajectory, output in jobs]
+
     with open(cpptraj_file, 'w') as file:
-        file.writelines([f'parm {topology}\n',
-                        f'trajin {trajectory}\n',
-                        f'strip {to_strip}\n',
-                        f'trajout {output}\n',
-                         'go\nquit\n'])
+        file.write('clear all\n'.join(blocks) + 'quit\n')
 
     subprocess.run(['cpptraj', '-i', cpptraj_file])
     os.remove(cpptraj_file)
 
     return None
 
-def __parse_seeds(seeds):
-    if isinstance(seeds, (list, tuple)):
-        if not all(isinstance(idx, int) for idx in seeds):
-            raise TypeError('Seed indices must all be of type int')
-        else:
-            return seeds
-    elif isinstance(seeds, str):
-        if '-' in seeds:
-            idx_range = [int(idx) for idx in seeds.split('-')]
-            return np.arange(idx_range[0], idx_range[1]+1).tolist()
-        elif ',' in seeds:
-            return [int(idx) for idx in seeds.split(',')]
-        else:
-            return [int(seeds)]
-    elif isinstance(seeds, int):
-        return [seeds]
-    else:
-        raise TypeError('Seeds must be of type str, int, list or tuple')
-
-
 def __parse_time(input, output_units, output_digits=3, output_type='string'):
     """Parse time given as a string and return either as string with units or numerical value
 
@@ -168,20 +229,18 @@ def __parse_time(input, output_units, output_digits=3, output_type='string'):
     output_type : str
         type of output to give. If "string" it will be "value unit" and if "number" it will be the numerical value 
     """
-    conversion = {'fs': -15, 'ps': -12, 'ns': -9, 'us': -6, 'ms': -3, 's': 0}
-
     components = input.split(' ')
 
     try:
         value = int(components[0]) # get numerical value
-        value = value * 10**(conversion[components[1]]) # convert to seconds
+        value = value * _TIME_FACTOR[components[1]] # convert to seconds
     except:
         raise ValueError(f'Time has to be in the format "value unit", e.g. "10 ps". Time provided: {input}')
     
-    output_value = round(value * 10**(-1*conversion[output_units]), output_digits)
+    output_value = round(value / _TIME_FACTOR[output_units], output_digits)
 
     if output_type == 'string':
-        return f'{output_value} {output_units.replace("u", "μ")}'
+        return f'{output_value} {_TIME_LABEL[output_units]}'
     elif output_type == 'number':
         return output_value
     else:
@@ -196,21 +255,28 @@ def __check_cpptraj():
 
 
 def __get_trajectory(trajectory, topology):
+    from pytraj import Trajectory, save
+
     if isinstance(trajectory, str) and topology is None:
         raise ValueError('If providing a trajectory file path, a topology file is also required')
     elif isinstance(trajectory, str):
         return os.path.abspath(trajectory), os.path.abspath(topology), False
     elif isinstance(trajectory, Trajectory):
-        trajectory_file = '/tmp/' + __random_name() + '.nc'
-        topology_file = '/tmp/' + __random_name() + '.prm7'
-        save(trajectory_file, trajectory)
-        save(topology_file, trajectory.top)
+        # reserve unique file names so concurrent calls cannot collide, callers remove them
+        with NamedTemporaryFile(suffix='.nc', delete=False) as file:
+            trajectory_file = file.name
+        with NamedTemporaryFile(suffix='.prm7', delete=False) as file:
+            topology_file = file.name
+        save(trajectory_file, trajectory, overwrite=True)
+        save(topology_file, trajectory.top, overwrite=True)
         return trajectory_file, topology_file, True
     else:
         raise TypeError(f'Unsupported trajectory type: {type(trajectory)}. Trajectory has to be str of a file path or a pytraj.Trajectory')
 
 
-def __add_restraint(process, restraint, system):
+def __add_restraint(process, restraint, topology):
+    from BioSimSpace.Process import Amber
+
     # check that AMBER process
     if not isinstance(process, Amber):
         raise TypeError(f'Restraints supported for AMBER simulations only')
@@ -222,12 +288,21 @@ def __add_restraint(process, restraint, system):
             restraint = file.readlines()
     
     # loop over each line
+    atom_indices = None
     for i, line in enumerate(restraint):
         if 'iat' in line:
+            if atom_indices is None:
+                atom_indices = __map_restraint_atoms(topology)
             parts = line.replace('\n', '').split() # remove newline character and split
             for j, part in enumerate(parts):
                 if part != 'iat=' and part != 'iat' and part != '=': # check if not reasonable pointers to atoms. This means the restraint file has to be tidy, with atoms on a separate line
-                    atom = system.topology.select(part)+1 # add 1 to index from 1
+                    # look up single atoms directly, anything more complex goes through the mask parser
+                    match = _ATOM_MASK_RE.match(part)
+                    key = (int(match.group(1)), match.group(2)) if match is not None else None
+                    if key in atom_indices and atom_indices[key] is None:
+                        raise ValueError(f'More than 1 restraint atom {part} found')
+                    idx = atom_indices.get(key)
+                    atom = [idx+1] if idx is not None else topology.select(part)+1 # add 1 to index from 1
                     if len(atom) == 0:
                         raise ValueError(f'Restraint atom {part} not found')
                     elif len(atom) > 1:
@@ -241,13 +316,9 @@ def __add_restraint(process, restraint, system):
         file.writelines(restraint)
 
     # change the process config file
-    config = process.getConfig()[:-1] # remove the "/" character
-    config += ["  nmropt=1,",
-               " /",
-               " &wt type='REST', istep1=0,istep2=3000,value1=0.1,value2=1.0,  /",
-               " &wt type='REST', istep1=3000,istep2=0,value1=1.0,value2=1.0  /",
-               "&wt type='END'  /",
-               "DISANG=RST"]
+    config = process.getConfig()
+    config.pop() # remove the "/" character
+    config.extend(_RESTRAINT_TAIL)
     process.setConfig(config)
 
     return None
\ No newline at end of file
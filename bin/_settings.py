@@ -1,38 +1,50 @@
 import yaml
 import os as os
-import numpy as np
+import pickle
+from importlib.util import spec_from_file_location, module_from_spec
+
+try:
+    from yaml import CSafeLoader as __Loader
+except ImportError:
+    __Loader = yaml.SafeLoader
+
+
+def __load_config(config_file):
+    """Load a YAML config, reusing a pickled copy next to it while the YAML is unchanged"""
+    cache_file = f'{config_file}.pkl'
+    if os.path.exists(cache_file) and os.path.getmtime(cache_file) > os.path.getmtime(config_file):
+        with open(cache_file, 'rb') as file:
+            return pickle.load(file)
+
+    with open(config_file, 'r') as file:
+        config = yaml.load(file, Loader=__Loader)
+
+    # caching is optional, e.g. if the config is in a read-only location
+    try:
+        with open(cache_file, 'wb') as file:
+            pickle.dump(config, file)
+    except OSError:
+        pass
+
+    return config
+
 
 # get allostery settings
-with open(f'{os.environ["AMMO_HOME"]}/config', 'r') as file:
-    _ammo = yaml.load(file, Loader=yaml.FullLoader)
+_ammo = __load_config(f'{os.environ["AMMO_HOME"]}/config')
 
 # get current project settings
 __config_file = f'{_ammo["location"]}/{_ammo["project"]}/.defaults/config'
 if not os.path.exists(__config_file):
     __config_file = f'{os.environ["AMMO_HOME"]}/data/project_default'  # change to default if no project settings
 
-with open(__config_file, 'r') as file:
-    _project = yaml.load(file, Loader=yaml.FullLoader)
-
+_project = __load_config(__config_file)
 
 _system_folders = ['system-setup', 'equilibrium', 'seeded-md', 'seeded-md/steering']
 
 
-def __parse_seeds(seeds):
-    if isinstance(seeds, (list, tuple)):
-        if not all(isinstance(idx, int) for idx in seeds):
-            raise TypeError('Seed indices must all be of type int')
-        else:
-            return seeds
-    elif isinstance(seeds, str):
-        if '-' in seeds:
-            idx_range = [int(idx) for idx in seeds.split('-')]
-            return np.arange(idx_range[0], idx_range[1]+1).tolist()
-        elif ',' in seeds:
-            return [int(idx) for idx in seeds.split(',')]
-        else:
-            return [int(seeds)]
-    elif isinstance(seeds, int):
-        return [seeds]
-    else:
-        raise TypeError('Seeds must be of type str, int, list or tuple')
\ No newline at end of file
+# share seed parsing with the ammo package. The file is loaded directly, importing it through
+# the package would pull in the simulation dependencies
+__spec = spec_from_file_location('_seeds', f'{os.environ["AMMO_HOME"]}/ammo/utils/_seeds.py')
+__seeds = module_from_spec(__spec)
+__spec.loader.exec_module(__seeds)
+__parse_seeds = __seeds.__parse_seeds
@@ -2,6 +2,10 @@ from os import environ, listdir, path
 from argparse import ArgumentParser
 
 
+# AMMO_HOME, the directory containing this file
+_HOME = path.dirname(path.realpath(__file__))
+
+
 def __change_interpreter(file, interpreter):
     with open(file, 'r') as fl:
         contents = fl.readlines()
@@ -14,30 +18,24 @@ def __change_interpreter(file, interpreter):
 
 
 def __check_for_python3(interpreter):
-    # find AMMO_HOME
-    home = '/'.join(path.realpath(__file__).split('/')[:-1])
-
     # check that interpreter exists
     if not path.exists(interpreter):
         raise ValueError(f'{interpreter} not found')
     
     # change in scripts if needed
     if interpreter != '/usr/bin/python3':
-        for file in listdir(f'{home}/bin'):
+        for file in listdir(f'{_HOME}/bin'):
             if not file.endswith('.py'):
                 print()
-                __change_interpreter(f'{home}/bin/{file}', interpreter)
+                __change_interpreter(f'{_HOME}/bin/{file}', interpreter)
     
     return None
 
 
 def __set_home():
-    # find location
-    home = '/'.join(path.realpath(__file__).split('/')[:-1])
-
     # prepare file contents
-    source_file = f'{home}/ammo.sh'
-    contents = [f'export AMMO_HOME={home}\n',
+    source_file = f'{_HOME}/ammo.sh'
+    contents = [f'export AMMO_HOME={_HOME}\n',
                  'export PATH="$AMMO_HOME/bin:$PATH"\n\n',
                  'if [ -z "$PYTHONPATH" ]; then\n',
                  '  export PYTHONPATH="$AMMO_HOME"\n',
@@ -48,10 +46,10 @@ def __set_home():
     # write new file
     with open(source_file, 'w') as file:
         file.writelines(contents)
-    print(f'AMMO_HOME set to {home}')
+    print(f'AMMO_HOME set to {_HOME}')
 
 
-    return home
+    return _HOME
 
 
 def __set_location(location, home):